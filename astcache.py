@@ -0,0 +1,109 @@
+import os
+import sys
+import ast
+import glob
+import atexit
+import contextlib
+import gc
+import pickle
+from collections import OrderedDict
+
+# Shared loader for the lab tools: parse_file(fname) gives the same tree as
+# ast.parse(open(fname).read()) but remembers it.
+#
+# Trees are kept pickled in memory, an LRU capped at AST_CACHE_MEMORY bytes,
+# keyed by the path, mtime and size. Unpickling is faster than parsing and
+# every call gets its own copy of the tree, so the tools that rewrite trees
+# in place (run --optimize) can't spoil the cache. Nothing is kept on disk:
+# unpickling a file found there would run whatever code it holds.
+#
+# Lookup counts are written to stderr when the program exits.
+
+MEMORY_LIMIT = int(os.environ.get("AST_CACHE_MEMORY", 64 * 1024 * 1024))
+
+_memory = OrderedDict()  # key -> pickled tree, oldest first
+_memory_used = 0
+stats = {"memory": 0, "parsed": 0}
+
+
+def _key(fname):
+    st = os.stat(fname)
+    return (os.path.abspath(fname), st.st_mtime_ns, st.st_size)
+
+
+def _remember(key, data):
+    global _memory_used
+    if len(data) > MEMORY_LIMIT:
+        return
+    old = _memory.pop(key, None)
+    if old is not None:
+        _memory_used -= len(old)
+    _memory[key] = data
+    _memory_used += len(data)
+    while _memory_used > MEMORY_LIMIT:
+        _, dropped = _memory.popitem(last=False)
+        _memory_used -= len(dropped)
+
+
+# Building a big tree allocates so many objects that the cyclic collector
+# runs over and over while it's going on, costing more than the parse or
+# unpickle itself; nothing in a fresh tree is garbage, so hold it off.
+@contextlib.contextmanager
+def _collector_paused():
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def parse_file(fname):
+    """ast.parse of fname's source, from the cache when the file is unchanged."""
+    key = _key(fname)
+    data = _memory.get(key)
+    if data is not None:
+        _memory.move_to_end(key)
+        stats["memory"] += 1
+        with _collector_paused():
+            return pickle.loads(data)
+
+    with open(fname, "r") as f, _collector_paused():
+        tree = ast.parse(f.read(), filename=fname)
+    stats["parsed"] += 1
+    try:
+        data = pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL)
+    except RecursionError:
+        # pickle recurses per level of nesting, long elif chains that the
+        # parser takes can be too deep for it; such a tree just isn't cached
+        return tree
+    _remember(key, data)
+    return tree
+
+
+def list_files(path):
+    """The .py files under directory path, or the files matching glob path,
+    in a stable order."""
+    if not os.path.isdir(path):
+        return sorted(glob.glob(path, recursive=True))
+    fnames = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+            if f.endswith(".py"):
+                fnames.append(os.path.join(root, f))
+    return fnames
+
+
+def report():
+    lookups = sum(stats.values())
+    rate = 100.0 * stats["memory"] / lookups if lookups else 0.0
+    return (f"AST cache: {lookups} lookups, {stats['memory']} hits, "
+            f"{stats['parsed']} parsed ({rate:.0f}% hit rate)")
+
+
+@atexit.register
+def _report_at_exit():
+    if sum(stats.values()):
+        print(report(), file=sys.stderr)
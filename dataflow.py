@@ -0,0 +1,294 @@
+import heapq
+import time
+from collections import deque
+
+# Monotone dataflow framework shared by the lab tools.
+#
+# An analysis is a Problem: a direction, a bottom value, join, a transfer
+# function per node and the value at the boundary (the entry nodes going
+# forward, the exit nodes going backward). solve() runs it over a Graph of
+# numbered nodes, usually basic blocks, to the least fixpoint, which is the
+# same whatever order the worklist hands out nodes; only the work done to
+# get there depends on the scheduler:
+#
+#   fifo  nodes in the order they were queued, starting in id order
+#   rpo   always the queued node earliest in reverse postorder, so a node
+#         mostly comes after its predecessors (in the analysis direction)
+#   loop  the queued node in the most deeply nested loop first, then by
+#         reverse postorder, so inner loops settle before what they feed
+#
+# Every solve returns its SolverStats: worklist iterations, transfer calls
+# and wall time.
+
+
+class Graph:
+    """Nodes 0..count-1 with preds[n]/succs[n] lists; entries and exits are
+    where forward and backward analyses start."""
+
+    def __init__(self, count, preds, succs, entries, exits=()):
+        self.count = count
+        self.preds = preds
+        self.succs = succs
+        self.entries = list(entries)
+        self.exits = list(exits)
+
+
+class Problem:
+    """Base for analyses: override join and transfer, and bottom/backward
+    and boundary when the defaults don't fit. Values are compared with !=,
+    so they should be immutable (ints, frozensets, tuples)."""
+
+    backward = False
+    bottom = None
+
+    def boundary(self, n):
+        return self.bottom
+
+    def join(self, a, b):
+        raise NotImplementedError
+
+    def transfer(self, n, value):
+        raise NotImplementedError
+
+
+class SolverStats:
+    def __init__(self, name, scheduler, nodes):
+        self.name = name
+        self.scheduler = scheduler
+        self.nodes = nodes
+        self.iterations = 0  # nodes taken off the worklist
+        self.transfers = 0  # transfer function calls, skipped when the input didn't change
+        self.seconds = 0.0
+
+    def add(self, other):
+        self.nodes += other.nodes
+        self.iterations += other.iterations
+        self.transfers += other.transfers
+        self.seconds += other.seconds
+
+    def __str__(self):
+        return (f"{self.name} [{self.scheduler}]: {self.iterations} iterations, "
+                f"{self.transfers} transfers for {self.nodes} nodes, {self.seconds * 1000:.2f} ms")
+
+
+class Solution:
+    """ins[n]/outs[n] are the values on the way into and out of n in the
+    analysis direction; before/after give them in program order."""
+
+    def __init__(self, backward, ins, outs, stats):
+        self.ins = ins
+        self.outs = outs
+        self.before, self.after = (outs, ins) if backward else (ins, outs)
+        self.stats = stats
+
+
+def reverse_postorder(count, succs, starts):
+    """Nodes in reverse postorder of a depth-first search from starts; the
+    ones it can't reach follow in id order."""
+    seen = [False] * count
+    post = []
+    for start in starts:
+        if seen[start]:
+            continue
+        seen[start] = True
+        stack = [(start, iter(succs[start]))]
+        while stack:
+            n, it = stack[-1]
+            for s in it:
+                if not seen[s]:
+                    seen[s] = True
+                    stack.append((s, iter(succs[s])))
+                    break
+            else:
+                stack.pop()
+                post.append(n)
+    post.reverse()
+    return post + [n for n in range(count) if not seen[n]]
+
+
+def loop_depths(count, preds, succs, starts):
+    """How many loops each node is in. A loop is the natural loop of the
+    edges that go back to a node still on the depth-first search stack,
+    one per such header; for irreducible flow that is only an estimate,
+    which is fine for ordering a worklist."""
+    order = reverse_postorder(count, succs, starts)
+    rank = [0] * count
+    for i, n in enumerate(order):
+        rank[n] = i
+    # in reverse postorder, tree, forward and cross edges all go forward; the
+    # ones that don't go back to a node on the stack
+    tails = {}
+    for n in range(count):
+        for s in succs[n]:
+            if rank[s] <= rank[n]:
+                tails.setdefault(s, []).append(n)
+    depth = [0] * count
+    for header, ends in tails.items():
+        body = {header}
+        stack = [t for t in ends if t != header]
+        body.update(stack)
+        while stack:
+            n = stack.pop()
+            for p in preds[n]:
+                if p not in body:
+                    body.add(p)
+                    stack.append(p)
+        for n in body:
+            depth[n] += 1
+    return depth
+
+
+# Cooper, Harvey and Kennedy, "A Simple, Fast Dominance Algorithm"
+def dominators(preds, order):
+    """Immediate dominator of every node, from a reverse postorder that
+    starts at the entry. The entry is its own, nodes the entry can't reach
+    have None."""
+    count = len(preds)
+    index = [0] * count
+    for i, n in enumerate(order):
+        index[n] = i
+    idom = [None] * count
+    idom[order[0]] = order[0]
+
+    def intersect(a, b):
+        while a != b:
+            while index[a] > index[b]:
+                a = idom[a]
+            while index[b] > index[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for n in order[1:]:
+            new = None
+            for p in preds[n]:
+                if idom[p] is not None:
+                    new = p if new is None else intersect(p, new)
+            if idom[n] != new:
+                idom[n] = new
+                changed = True
+    return idom
+
+
+def dominance_frontiers(preds, idom):
+    """frontier[n]: the nodes where n's dominance ends, as sets."""
+    frontier = [set() for _ in preds]
+    for n, ps in enumerate(preds):
+        if idom[n] is None:
+            continue
+        ps = [p for p in ps if idom[p] is not None]
+        if len(ps) < 2:
+            continue
+        for p in ps:
+            runner = p
+            while runner != idom[n]:
+                frontier[runner].add(n)
+                runner = idom[runner]
+    return frontier
+
+
+class FifoWorklist:
+    def __init__(self, count):
+        self.queue = deque(range(count))
+        self.queued = [True] * count
+
+    def __bool__(self):
+        return bool(self.queue)
+
+    def push(self, n):
+        if not self.queued[n]:
+            self.queued[n] = True
+            self.queue.append(n)
+
+    def pop(self):
+        n = self.queue.popleft()
+        self.queued[n] = False
+        return n
+
+
+class PriorityWorklist:
+    """Hands out the queued node of lowest rank."""
+
+    def __init__(self, rank):
+        self.rank = rank
+        self.heap = [(r, n) for n, r in enumerate(rank)]
+        heapq.heapify(self.heap)
+        self.queued = [True] * len(rank)
+
+    def __bool__(self):
+        return bool(self.heap)
+
+    def push(self, n):
+        if not self.queued[n]:
+            self.queued[n] = True
+            heapq.heappush(self.heap, (self.rank[n], n))
+
+    def pop(self):
+        n = heapq.heappop(self.heap)[1]
+        self.queued[n] = False
+        return n
+
+
+def _ranks(order):
+    rank = [0] * len(order)
+    for i, n in enumerate(order):
+        rank[n] = i
+    return rank
+
+
+def fifo_schedule(count, preds, succs, starts):
+    return FifoWorklist(count)
+
+
+def rpo_schedule(count, preds, succs, starts):
+    return PriorityWorklist(_ranks(reverse_postorder(count, succs, starts)))
+
+
+def loop_schedule(count, preds, succs, starts):
+    rpo = _ranks(reverse_postorder(count, succs, starts))
+    depth = loop_depths(count, preds, succs, starts)
+    return PriorityWorklist(_ranks(sorted(range(count), key=lambda n: (-depth[n], rpo[n]))))
+
+
+SCHEDULERS = {
+    "fifo": fifo_schedule,
+    "rpo": rpo_schedule,
+    "loop": loop_schedule,
+}
+
+
+def solve(graph, problem, scheduler="rpo", name=None):
+    """Least fixpoint of problem over graph, as a Solution."""
+    started = time.perf_counter()
+    if problem.backward:
+        preds, succs, starts = graph.succs, graph.preds, graph.exits
+    else:
+        preds, succs, starts = graph.preds, graph.succs, graph.entries
+    count = graph.count
+    stats = SolverStats(name or type(problem).__name__, scheduler, count)
+    work = SCHEDULERS[scheduler](count, preds, succs, starts)
+    boundary = set(starts)
+    bottom, join, transfer = problem.bottom, problem.join, problem.transfer
+    ins = [bottom] * count
+    outs = [bottom] * count
+    done = [False] * count  # transferred at least once
+    while work:
+        n = work.pop()
+        stats.iterations += 1
+        value = problem.boundary(n) if n in boundary else bottom
+        for p in preds[n]:
+            value = join(value, outs[p])
+        if done[n] and value == ins[n]:
+            continue  # same input, same output
+        ins[n] = value
+        done[n] = True
+        new = transfer(n, value)
+        stats.transfers += 1
+        if new != outs[n]:
+            outs[n] = new
+            for s in succs[n]:
+                work.push(s)
+    stats.seconds = time.perf_counter() - started
+    return Solution(problem.backward, ins, outs, stats)
@@ -1,23 +1,34 @@
 import ast
 import sys
 import os
+import hashlib
+import shutil
+import subprocess
+import multiprocessing
+from collections import Counter
 from graphviz import Digraph
+import labpath  # puts the top of the repo, with the shared modules, on sys.path
+import astcache
 
-def ast_to_graph(node, graph=None, parent=None):
-    if graph is None:
-        graph = Digraph()
-
+def dot_label(node):
     # Default label: type of node
-    node_label = type(node).__name__
+    label = type(node).__name__
 
     # Special case for Name: include id and ctx in label
     if isinstance(node, ast.Name):
         ctx = type(node.ctx).__name__ if hasattr(node, "ctx") else ""
-        node_label += f'\n id="{node.id}" ctx={ctx}'
+        label += f'\n id="{node.id}" ctx={ctx}'
 
     # Special case for Constant: show value
     elif isinstance(node, ast.Constant):
-        node_label += f'\n value={node.value!r}'
+        label += f'\n value={node.value!r}'
+    return label
+
+def ast_to_graph(node, graph=None, parent=None):
+    if graph is None:
+        graph = Digraph()
+
+    node_label = dot_label(node)
 
     this_id = str(id(node))
     graph.node(this_id, node_label, shape="box")
@@ -39,19 +50,227 @@ def ast_to_graph(node, graph=None, parent=None):
 
     return graph
 
+# --- Streaming DOT emitter ---
+#
+# ast_to_graph keeps the whole Digraph in memory and recurses, which falls
+# over on big modules. write_dot walks the tree with an explicit stack and
+# writes every node to the file as soon as it is reached. Node names are
+# sequential (n0, n1, ...) so the same file always gives the same DOT. With
+# --collapse, a subtree that already appeared is drawn as one node with its
+# count.
+
+def dot_children(node):
+    # same children as ast_to_graph, skipping ctx
+    for field, value in ast.iter_fields(node):
+        if field == "ctx":
+            continue
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, ast.AST):
+                    yield item
+        elif isinstance(value, ast.AST):
+            yield value
+
+def dot_quote(text):
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+# structural key and size of every subtree, keyed by id(node)
+def subtree_keys(tree):
+    keys = {}
+    sizes = {}
+    stack = [(tree, False)]
+    while stack:
+        node, children_done = stack.pop()
+        kids = list(dot_children(node))
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((kid, False) for kid in kids)
+            continue
+        h = hashlib.blake2b(dot_label(node).encode(), digest_size=16)
+        size = 1
+        for kid in kids:
+            h.update(keys[id(kid)])
+            size += sizes[id(kid)]
+        keys[id(node)] = h.digest()
+        sizes[id(node)] = size
+    return keys, sizes
+
+def write_dot(tree, out, max_depth=None, max_nodes=None, collapse=False):
+    keys, sizes = subtree_keys(tree)
+    counts = Counter(keys.values())
+    seen = set()
+    emitted = 0
+
+    def emit(label, parent):
+        nonlocal emitted
+        nid = f"n{emitted}"
+        emitted += 1
+        out.write(f"  {nid} [label={dot_quote(label)}];\n")
+        if parent is not None:
+            out.write(f"  {parent} -> {nid};\n")
+        return nid
+
+    out.write("digraph {\n  node [shape=box];\n")
+    stack = [(tree, None, 0)]
+    while stack:
+        node, parent, depth = stack.pop()
+        if max_nodes is not None and emitted >= max_nodes:
+            hidden = sizes[id(node)] + sum(sizes[id(n)] for n, _, _ in stack)
+            # hang the marker where the first missing node would have gone
+            emit(f"... {hidden} more nodes (--max-nodes {max_nodes})", parent)
+            break
+
+        kids = list(dot_children(node))
+        key = keys[id(node)]
+        label = dot_label(node)
+        repeated = collapse and kids and counts[key] > 1
+        if repeated and key in seen:
+            emit(f"{label}\n(repeated subtree, {counts[key]} times)", parent)
+            continue
+        if repeated:
+            label += f"\n(subtree appears {counts[key]} times)"
+            seen.add(key)
+        nid = emit(label, parent)
+
+        if kids and max_depth is not None and depth >= max_depth:
+            emit(f"... {sizes[id(node)] - 1} nodes below depth {max_depth}", nid)
+            continue
+        for kid in reversed(kids):
+            stack.append((kid, nid, depth + 1))
+    out.write("}\n")
+    return emitted
+
+
+# writes the graph as <outname>.<fmt>, png and svg go through a .dot that
+# the dot binary renders
+def render(tree, outname, fmt="png", max_depth=None, max_nodes=None, collapse=False):
+    with open(f"{outname}.dot", "w") as out:
+        count = write_dot(tree, out, max_depth, max_nodes, collapse)
+    if fmt != "dot":
+        subprocess.run(["dot", f"-T{fmt}", f"{outname}.dot", "-o", f"{outname}.{fmt}"], check=True)
+        os.remove(f"{outname}.dot")
+    return count
+
+
+# --- Batch rendering with a content-addressed cache ---
+#
+# Images are stored in the cache under the hash of the AST (so formatting
+# and comments don't matter) plus the render options, and a file is only
+# rendered when no image with its hash exists yet.
+
+CACHE_VERSION = 1
+
+def render_key(tree, fmt, max_depth, max_nodes, collapse):
+    keys, _ = subtree_keys(tree)
+    h = hashlib.blake2b(keys[id(tree)], digest_size=16)
+    h.update(f"{CACHE_VERSION}|{fmt}|{max_depth}|{max_nodes}|{collapse}".encode())
+    return h.hexdigest()
+
+def _render_cached(job):
+    filename, cache_path, fmt, max_depth, max_nodes, collapse = job
+    # render under a temporary name so a half written image never looks
+    # like a cache hit
+    tmp = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        tree = astcache.parse_file(filename)
+        render(tree, tmp, fmt, max_depth, max_nodes, collapse)
+        os.replace(f"{tmp}.{fmt}", f"{cache_path}.{fmt}")
+        return filename, None
+    except (OSError, subprocess.CalledProcessError) as e:
+        for leftover in (f"{tmp}.dot", f"{tmp}.{fmt}"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        return filename, e
+
+def render_batch(dirname, cache_dir=".ast_cache", fmt="png", max_depth=None,
+                 max_nodes=None, collapse=False, workers=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    jobs = {}  # cache path -> the file that will render it
+    outputs = []  # (cached image, image next to the source file)
+    hits = rendered = errors = 0
+    duplicates = Counter()  # cache path -> files after the first with that AST
+    for filename in astcache.list_files(dirname):
+        try:
+            tree = astcache.parse_file(filename)
+        except (SyntaxError, UnicodeDecodeError) as e:
+            print(f"Skipping {filename}: {e}")
+            errors += 1
+            continue
+        cache_path = os.path.join(cache_dir, render_key(tree, fmt, max_depth, max_nodes, collapse))
+        # files with the same AST in one batch are rendered once
+        if os.path.exists(f"{cache_path}.{fmt}"):
+            hits += 1
+        elif cache_path in jobs:
+            duplicates[cache_path] += 1
+        else:
+            jobs[cache_path] = filename
+        base, _ = os.path.splitext(filename)
+        outputs.append((f"{cache_path}.{fmt}", f"{base}_ast.{fmt}"))
+
+    if jobs:
+        work = [(filename, path, fmt, max_depth, max_nodes, collapse) for path, filename in jobs.items()]
+        with multiprocessing.Pool(workers) as pool:
+            for filename, error in pool.imap_unordered(_render_cached, work):
+                if error is not None:
+                    print(f"Could not render {filename}: {error}")
+                    errors += 1
+                else:
+                    rendered += 1
+    # a duplicate only got its image if the render of its twin worked
+    for path, count in duplicates.items():
+        if os.path.exists(f"{path}.{fmt}"):
+            hits += count
+        else:
+            errors += count
+
+    for cached, outname in outputs:
+        if os.path.exists(cached):
+            shutil.copyfile(cached, outname)
+    print(f"{len(outputs)} files: {hits} cache hits, {rendered} misses rendered, {errors} errors")
+    return errors
+
+
+USAGE = (f"Usage: python {sys.argv[0]} [--max-depth N] [--max-nodes N] [--collapse] [--format png|svg|dot] <python_file>\n"
+         f"       python {sys.argv[0]} [same options] [--cache DIR] [--workers N] --batch <dir>")
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print(f"Usage: python {sys.argv[0]} <python_file>")
+    args = sys.argv[1:]
+    options = {"--max-depth": None, "--max-nodes": None, "--format": "png",
+               "--cache": ".ast_cache", "--workers": None}
+    collapse = False
+    batch = False
+    while len(args) > 1 and args[0].startswith("--"):
+        if args[0] == "--collapse":
+            collapse = True
+            args = args[1:]
+        elif args[0] == "--batch":
+            batch = True
+            args = args[1:]
+        elif args[0] in options and len(args) > 2:
+            options[args[0]] = args[1]
+            args = args[2:]
+        else:
+            break
+    if len(args) != 1 or options["--format"] not in ("png", "svg", "dot"):
+        print(USAGE)
         sys.exit(1)
+    max_depth = int(options["--max-depth"]) if options["--max-depth"] else None
+    max_nodes = int(options["--max-nodes"]) if options["--max-nodes"] else None
+    fmt = options["--format"]
 
-    filename = sys.argv[1]
-    with open(filename, "r") as f:
-        code = f.read()
+    if batch:
+        workers = int(options["--workers"]) if options["--workers"] else None
+        errors = render_batch(args[0], options["--cache"], fmt, max_depth, max_nodes, collapse, workers)
+        sys.exit(1 if errors else 0)
 
-    tree = ast.parse(code, filename=filename)
-    graph = ast_to_graph(tree)
+    filename = args[0]
+    tree = astcache.parse_file(filename)
 
     base, _ = os.path.splitext(filename)
     outname = f"{base}_ast"
-    graph.render(outname, format="png", cleanup=True)
-    print(f"AST graph saved as {outname}.png")
+    try:
+        count = render(tree, outname, fmt, max_depth, max_nodes, collapse)
+    except FileNotFoundError:
+        print(f"Graphviz dot not found, AST graph left as {outname}.dot")
+        sys.exit(1)
+    print(f"AST graph with {count} nodes saved as {outname}.{fmt}")
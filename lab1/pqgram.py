@@ -0,0 +1,138 @@
+import hashlib
+import pickle
+import numpy as np
+
+# Approximate tree similarity with pq-grams (Augsten et al.).
+#
+# A pq-gram is a node with its p - 1 closest ancestors and q consecutive
+# children, padded with "*" where the tree runs out. The bag of pq-grams of
+# a tree (its profile) changes only locally when the tree is edited, so the
+# pq-gram distance tracks tree edit distance at a fraction of the cost.
+#
+# To avoid comparing a query against every profile, each profile is reduced
+# to a MinHash signature and the signature is cut into LSH bands. Only
+# profiles that share a whole band with the query are ever looked at.
+
+INDEX_VERSION = 1
+DUMMY = "*"
+_MASK = (1 << 64) - 1
+
+
+# stable 64 bit hash, python's hash() changes between runs
+def _gram_hash(labels):
+    h = hashlib.blake2b("\x1f".join(labels).encode(), digest_size=8)
+    return int.from_bytes(h.digest(), "little")
+
+
+def profile(root, get_children, get_label, p=2, q=3):
+    """pq-gram profile of a tree as {gram hash: count}."""
+    grams = {}
+
+    def emit(anc, sib):
+        g = _gram_hash(anc + sib)
+        grams[g] = grams.get(g, 0) + 1
+
+    # iterative preorder carrying the ancestor register down the tree
+    stack = [(root, (DUMMY,) * (p - 1))]
+    while stack:
+        node, parents = stack.pop()
+        anc = parents + (get_label(node),)
+        kids = list(get_children(node))
+        if not kids:
+            emit(anc, (DUMMY,) * q)
+        else:
+            sib = (DUMMY,) * q
+            for c in kids:
+                sib = sib[1:] + (get_label(c),)
+                emit(anc, sib)
+            for _ in range(q - 1):
+                sib = sib[1:] + (DUMMY,)
+                emit(anc, sib)
+        child_parents = anc[1:]
+        for c in reversed(kids):
+            stack.append((c, child_parents))
+    return grams
+
+
+def pq_distance(prof1, prof2):
+    """pq-gram distance between two profiles, 0 for identical bags."""
+    if len(prof1) > len(prof2):
+        prof1, prof2 = prof2, prof1
+    shared = 0
+    for g, c in prof1.items():
+        other = prof2.get(g)
+        if other:
+            shared += c if c < other else other
+    total = sum(prof1.values()) + sum(prof2.values())
+    return 1.0 - 2.0 * shared / total if total else 0.0
+
+
+class PQGramIndex:
+    def __init__(self, p=2, q=3, num_perm=64, bands=16, seed=523):
+        if num_perm % bands:
+            raise ValueError("num_perm has to be a multiple of bands")
+        self.p = p
+        self.q = q
+        self.num_perm = num_perm
+        self.bands = bands
+        rng = np.random.default_rng(seed)
+        # multiply-shift hash functions, odd multipliers
+        self.mul = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.inc = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self.names = []
+        self.profiles = []
+        self.buckets = [{} for _ in range(bands)]
+
+    def signature(self, prof):
+        # a gram seen c times becomes c distinct elements so MinHash
+        # estimates the bag overlap rather than the set overlap
+        elems = []
+        for g, c in prof.items():
+            for i in range(c):
+                elems.append((g + i * 0x9E3779B97F4A7C15) & _MASK)
+        if not elems:
+            return np.zeros(self.num_perm, dtype=np.uint64)
+        x = np.array(elems, dtype=np.uint64)
+        # uint64 arithmetic wraps, which is the mod 2**64 we want
+        with np.errstate(over="ignore"):
+            h = x[:, None] * self.mul[None, :] + self.inc[None, :]
+        return h.min(axis=0)
+
+    def _band_keys(self, sig):
+        rows = self.num_perm // self.bands
+        return [sig[b * rows:(b + 1) * rows].tobytes() for b in range(self.bands)]
+
+    def add(self, name, prof):
+        doc = len(self.names)
+        self.names.append(name)
+        self.profiles.append(prof)
+        for band, key in zip(self.buckets, self._band_keys(self.signature(prof))):
+            band.setdefault(key, []).append(doc)
+        return doc
+
+    def candidates(self, prof):
+        found = set()
+        for band, key in zip(self.buckets, self._band_keys(self.signature(prof))):
+            found.update(band.get(key, ()))
+        return sorted(found)
+
+    def query(self, prof, k=10):
+        """Up to k (name, pq-gram distance) pairs, closest first."""
+        scored = [(pq_distance(prof, self.profiles[doc]), self.names[doc])
+                  for doc in self.candidates(prof)]
+        scored.sort()
+        return [(name, dist) for dist, name in scored[:k]]
+
+    def save(self, fname):
+        with open(fname, "wb") as f:
+            pickle.dump((INDEX_VERSION, self.__dict__), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, fname):
+        with open(fname, "rb") as f:
+            version, state = pickle.load(f)
+        if version != INDEX_VERSION:
+            raise ValueError(f"{fname} is an index of version {version}, expected {INDEX_VERSION}")
+        index = cls.__new__(cls)
+        index.__dict__.update(state)
+        return index
@@ -0,0 +1,273 @@
+import ast
+import operator
+
+# Optimization passes for the straight-line programs `treeops.py run`
+# executes: constant folding, common-subexpression elimination and dead
+# store elimination. Every pass edits the module in place and must leave the
+# printed result (and any error the program would raise) unchanged, so the
+# passes are told how the interpreter that will run the tree behaves.
+
+
+class Semantics:
+    __slots__ = ("ops", "result", "generic")
+
+    def __init__(self, ops, result, generic):
+        # BinOp operators the interpreter can evaluate
+        self.ops = ops
+        # "last_key": value of the name assigned first-most-recently
+        # (treeops temp_dict order), "last_assign": value of the last Assign
+        self.result = result
+        # True when other nodes are walked child by child (NodeVisitor's
+        # generic_visit), False when they are skipped and give None
+        self.generic = generic
+
+
+ARITH = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul}
+
+# treeops.calculate_ast / compile_ast
+CALCULATE_AST = Semantics(frozenset((ast.Add, ast.Sub, ast.Mult)), "last_key", False)
+# treeop_cop.SimpleProgramInterpreter / SimpleProgramCompiler
+SIMPLE_INTERPRETER = Semantics(frozenset((ast.Add, ast.Mult)), "last_assign", True)
+
+# folded constants bigger than this stay as expressions
+MAX_FOLDED_SIZE = 4096
+
+
+def count_nodes(tree):
+    return sum(1 for _ in ast.walk(tree))
+
+
+def optimize(tree, sem, inputs=()):
+    """Runs every pass over tree in place, returns [(pass name, nodes removed)].
+
+    inputs are names bound before the program starts (run-batch), assumed
+    to hold numbers.
+    """
+    stats = []
+    for name, run_pass in (("constant folding", fold_constants),
+                           ("common subexpression elimination", eliminate_common_subexpressions),
+                           ("dead store elimination", eliminate_dead_stores)):
+        before = count_nodes(tree)
+        run_pass(tree, sem, inputs)
+        stats.append((name, before - count_nodes(tree)))
+    return stats
+
+
+# --- statement helpers ---
+
+# Assign to a plain name, the only kind the interpreters store; they read
+# targets[0] and ignore the rest
+def assigned_name(stmt):
+    if isinstance(stmt, ast.Assign) and isinstance(stmt.targets[0], ast.Name):
+        return stmt.targets[0].id
+    return None
+
+
+# statements the passes understand: simple assigns, and in calculate_ast
+# also expression statements
+def is_simple(stmt, sem):
+    if assigned_name(stmt) is not None:
+        return True
+    return isinstance(stmt, ast.Expr) and not sem.generic
+
+
+# names a generic interpreter may assign while walking an opaque statement
+def nested_assigns(stmt, sem):
+    if not sem.generic:
+        return set()
+    return {name for node in ast.walk(stmt) if (name := assigned_name(node)) is not None}
+
+
+def all_loads(node):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+
+
+# names an expression reads when evaluated
+def reads(node, sem):
+    if isinstance(node, ast.Name):
+        return {node.id}
+    if isinstance(node, ast.BinOp):
+        return reads(node.left, sem) | reads(node.right, sem)
+    if isinstance(node, ast.Constant) or not sem.generic:
+        return set()
+    return all_loads(node)
+
+
+def _small(value):
+    if isinstance(value, int):
+        return value.bit_length() <= MAX_FOLDED_SIZE
+    if isinstance(value, (str, bytes)):
+        return len(value) <= MAX_FOLDED_SIZE
+    return True
+
+
+# --- constant folding and propagation ---
+
+def fold_constants(tree, sem, inputs=()):
+    consts = {}
+
+    def fold(node):
+        if isinstance(node, ast.Name) and node.id in consts:
+            return ast.copy_location(ast.Constant(consts[node.id]), node)
+        if not isinstance(node, ast.BinOp):
+            return node
+        node.left = fold(node.left)
+        node.right = fold(node.right)
+        if not (isinstance(node.left, ast.Constant) and isinstance(node.right, ast.Constant)):
+            return node
+        op = type(node.op)
+        if op not in sem.ops:
+            # calculate_ast gives None, the other interpreter raises
+            return node if sem.generic else ast.copy_location(ast.Constant(None), node)
+        try:
+            value = ARITH[op](node.left.value, node.right.value)
+        except Exception:
+            # leave it to raise at run time
+            return node
+        if not _small(value):
+            return node
+        return ast.copy_location(ast.Constant(value), node)
+
+    for stmt in tree.body:
+        name = assigned_name(stmt)
+        if name is not None:
+            stmt.value = fold(stmt.value)
+            if isinstance(stmt.value, ast.Constant):
+                consts[name] = stmt.value.value
+            else:
+                consts.pop(name, None)
+        elif is_simple(stmt, sem):
+            stmt.value = fold(stmt.value)
+        else:
+            for name in nested_assigns(stmt, sem):
+                consts.pop(name, None)
+
+
+# --- common subexpression elimination ---
+
+def eliminate_common_subexpressions(tree, sem, inputs=()):
+    # ast.dump of a BinOp -> (name holding its value, names it reads)
+    available = {}
+
+    def replace(node):
+        if not isinstance(node, ast.BinOp):
+            return node
+        hit = available.get(ast.dump(node))
+        if hit is not None:
+            return ast.copy_location(ast.Name(hit[0], ast.Load()), node)
+        node.left = replace(node.left)
+        node.right = replace(node.right)
+        return node
+
+    def kill(name):
+        for key, (holder, used) in list(available.items()):
+            if holder == name or name in used:
+                del available[key]
+
+    for stmt in tree.body:
+        name = assigned_name(stmt)
+        if name is not None:
+            stmt.value = replace(stmt.value)
+            kill(name)
+            used = reads(stmt.value, sem)
+            if isinstance(stmt.value, ast.BinOp) and name not in used:
+                available[ast.dump(stmt.value)] = (name, used)
+        elif is_simple(stmt, sem):
+            stmt.value = replace(stmt.value)
+        else:
+            for name in nested_assigns(stmt, sem):
+                kill(name)
+
+
+# --- dead store elimination ---
+
+def eliminate_dead_stores(tree, sem, inputs=()):
+    body = tree.body
+    if sem.generic and any(nested_assigns(stmt, sem) for stmt in body if not is_simple(stmt, sem)):
+        # assignments hidden inside walked statements, too hard to follow
+        return
+
+    def may_raise(node, bound):
+        if isinstance(node, ast.Name):
+            return node.id not in bound
+        if isinstance(node, ast.Constant):
+            return False
+        if isinstance(node, ast.BinOp):
+            if may_raise(node.left, bound) or may_raise(node.right, bound):
+                return True
+            if type(node.op) not in sem.ops:
+                return sem.generic
+            # folding already took every constant pair that can't raise
+            if isinstance(node.left, ast.Constant) and isinstance(node.right, ast.Constant):
+                return True
+            return not (_is_number(node.left, bound, sem) and _is_number(node.right, bound, sem))
+        return sem.generic
+
+    # forward: which statements cannot raise given what is bound (and holds
+    # a number) before them, only those are safe to drop
+    numeric = dict.fromkeys(inputs, True)
+    raises = []
+    for stmt in body:
+        if is_simple(stmt, sem):
+            raises.append(may_raise(stmt.value, numeric))
+        else:
+            raises.append(True)
+        name = assigned_name(stmt)
+        if name is not None:
+            numeric[name] = _is_number(stmt.value, numeric, sem)
+
+    def result_name(stmts):
+        names = [name for name in map(assigned_name, stmts) if name is not None]
+        if sem.result == "last_assign":
+            return names[-1] if names else None
+        order = dict.fromkeys(inputs)
+        for name in names:
+            order.setdefault(name)
+        return list(order)[-1] if order else None
+
+    result = result_name(body)
+    pinned = set()
+    while True:
+        live = {result} if result is not None else set()
+        keep = [False] * len(body)
+        for i in range(len(body) - 1, -1, -1):
+            stmt = body[i]
+            name = assigned_name(stmt)
+            if i in pinned:
+                keep[i] = True
+            elif name is not None and is_simple(stmt, sem):
+                keep[i] = name in live or raises[i]
+            elif isinstance(stmt, ast.Expr) and not sem.generic:
+                keep[i] = raises[i]
+            else:
+                # calculate_ast raises on a non-name target and skips every
+                # other statement, the generic interpreter walks them
+                keep[i] = sem.generic or isinstance(stmt, ast.Assign)
+                if sem.generic:
+                    live |= all_loads(stmt)
+                continue
+            if keep[i]:
+                if name is not None:
+                    live.discard(name)
+                live |= reads(stmt.value, sem)
+
+        kept = [stmt for stmt, k in zip(body, keep) if k]
+        new_result = result_name(kept)
+        if new_result == result:
+            break
+        # dropping the first store of some name moved it behind the result
+        # in temp_dict order; keep that store and try again
+        first = next(i for i, stmt in enumerate(body) if assigned_name(stmt) == new_result)
+        pinned.add(first)
+    tree.body = kept
+
+
+def _is_number(node, numeric, sem):
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, (int, float, complex))
+    if isinstance(node, ast.Name):
+        return numeric.get(node.id, False)
+    if isinstance(node, ast.BinOp):
+        return (type(node.op) in sem.ops and _is_number(node.left, numeric, sem)
+                and _is_number(node.right, numeric, sem))
+    return False
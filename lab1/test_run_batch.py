@@ -0,0 +1,28 @@
+import numpy as np
+
+import treeops
+
+
+def run_batch(tmp_path, source, **columns):
+    prog = tmp_path / "prog.py"
+    prog.write_text(source)
+    data = tmp_path / "data.npz"
+    np.savez(data, **columns)
+    out = tmp_path / "out.npy"
+    treeops.do_run_batch(str(prog), str(data), str(out))
+    return np.load(out, allow_pickle=True).tolist()
+
+
+def test_int32_columns_do_not_wrap(tmp_path):
+    x = np.array([69999, 3], dtype=np.int32)
+    assert run_batch(tmp_path, "y = x * x\n", x=x) == [4899860001, 9]
+
+
+def test_uint8_columns_go_negative(tmp_path):
+    x = np.array([0, 200], dtype=np.uint8)
+    assert run_batch(tmp_path, "y = x * x - 1\n", x=x) == [-1, 39999]
+
+
+def test_uint64_past_int64_stays_exact(tmp_path):
+    x = np.array([2**64 - 1], dtype=np.uint64)
+    assert run_batch(tmp_path, "y = x + 1\n", x=x) == [2**64]
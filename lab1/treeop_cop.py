@@ -1,6 +1,9 @@
 import sys
 import ast
-import zss
+import ted
+import runopt
+import labpath  # puts the top of the repo, with the shared modules, on sys.path
+import astcache
 
 # --- Utility Functions (Used by Exercise 2, 3, and 4) ---
 
@@ -89,20 +92,110 @@ class SimpleProgramInterpreter(ast.NodeVisitor):
         return None
 
 
+# --- Exercise 4: Closure Compiler ---
+
+class SimpleProgramCompiler:
+    # Same results and errors as SimpleProgramInterpreter, but the tree is
+    # dispatched once: each node becomes a closure and each variable a slot
+    # in a list. The interpreter has no control flow (generic_visit simply
+    # walks every child), so the evaluation order and which names are bound
+    # at each load are fixed at compile time.
+    def __init__(self):
+        self.slots = {}
+        self.last_slot = None
+
+    def compile(self, tree):
+        code = self.compile_node(tree)
+        nslots = len(self.slots)
+        last_slot = self.last_slot
+
+        # returns what evaluate() would: the value of the last assignment
+        def program():
+            env = [None] * nslots
+            if code is not None:
+                code(env)
+            return env[last_slot] if last_slot is not None else None
+        return program
+
+    # picks compile_<NodeType> like NodeVisitor.visit picks visit_<NodeType>;
+    # a result of None means the node does nothing at run time
+    def compile_node(self, node):
+        method = getattr(self, "compile_" + type(node).__name__, self.compile_generic)
+        return method(node)
+
+    def compile_generic(self, node):
+        children = []
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                children.extend(item for item in value if isinstance(item, ast.AST))
+            elif isinstance(value, ast.AST):
+                children.append(value)
+        codes = [c for c in map(self.compile_node, children) if c is not None]
+        if not codes:
+            return None
+        if len(codes) == 1:
+            only = codes[0]
+            def run_one(env):
+                only(env)
+            return run_one
+        def run_all(env):
+            for c in codes:
+                c(env)
+        return run_all
+
+    def compile_Assign(self, node):
+        value = self.compile_node(node.value) or (lambda env: None)
+        target = node.targets[0]
+        if not isinstance(target, ast.Name):
+            def bad_target(env):
+                value(env)
+                return target.id  # AttributeError, same as visit_Assign
+            return bad_target
+        i = self.slots.setdefault(target.id, len(self.slots))
+        self.last_slot = i
+        def assign(env):
+            env[i] = value(env)
+        return assign
+
+    def compile_BinOp(self, node):
+        left = self.compile_node(node.left) or (lambda env: None)
+        right = self.compile_node(node.right) or (lambda env: None)
+        if isinstance(node.op, ast.Add):
+            return lambda env: left(env) + right(env)
+        elif isinstance(node.op, ast.Mult):
+            return lambda env: left(env) * right(env)
+        def unsupported(env):
+            left(env)
+            right(env)
+            raise TypeError("Unsupported binary operation.")
+        return unsupported
+
+    def compile_Constant(self, node):
+        value = node.value
+        return lambda env: value
+
+    def compile_Name(self, node):
+        if not isinstance(node.ctx, ast.Load):
+            return None
+        name = node.id
+        if name not in self.slots:
+            def unbound(env):
+                raise NameError(f"Variable '{name}' used before assignment.")
+            return unbound
+        i = self.slots[name]
+        return lambda env: env[i]
+
+
 # --- Exercise 2 Implementation ---
 
 def do_cmp(fname1, fname2):
     try:
-        with open(fname1, "r") as f1, open(fname2, "r") as f2:
-            content1 = f1.read()
-            content2 = f2.read()
+        tree1 = astcache.parse_file(fname1)
+        tree2 = astcache.parse_file(fname2)
     except FileNotFoundError:
         print("Error: One or both files not found.")
         return -1
 
-    tree1 = ast.parse(content1, filename=fname1)
-    tree2 = ast.parse(content2, filename=fname2)
-
     def compare(n1, n2):
         if get_label(n1) != get_label(n2):
             return False
@@ -124,24 +217,30 @@ def do_cmp(fname1, fname2):
 
 # --- Exercise 3 Implementation ---
 
-def do_dst(fname1, fname2):
+def do_dst(fname1, fname2, max_dist=None):
     try:
-        with open(fname1, "r") as f1, open(fname2, "r") as f2:
-            content1 = f1.read()
-            content2 = f2.read()
+        tree1 = astcache.parse_file(fname1)
+        tree2 = astcache.parse_file(fname2)
     except FileNotFoundError:
         print("Error: One or both files not found.")
         return -1
 
-    tree1 = ast.parse(content1, filename=fname1)
-    tree2 = ast.parse(content2, filename=fname2)
-
-    distance = zss.simple_distance(
-        tree1,
-        tree2,
-        get_children=get_children,
-        get_label=get_label
-    )
+    if max_dist is None:
+        distance = ted.simple_distance(
+            tree1,
+            tree2,
+            get_children=get_children,
+            get_label=get_label
+        )
+    else:
+        # count_ast_nodes skips the scalar children get_children hands to the
+        # distance, so the size bound uses the postorder tables instead
+        t1 = ted.PostorderTree.from_tree(tree1, get_children, get_label)
+        t2 = ted.PostorderTree.from_tree(tree2, get_children, get_label)
+        distance = ted.bounded_distance(t1, t2, max_dist)
+        if distance is None:
+            print(f"The tree edit distance is > {max_dist}")
+            return 0
 
     N1 = count_ast_nodes(tree1)
     N2 = count_ast_nodes(tree2)
@@ -158,18 +257,20 @@ def do_dst(fname1, fname2):
 
 # --- Exercise 4 Implementation ---
 
-def do_run(fname):
+def do_run(fname, interp=False, optimize=False):
     try:
-        with open(fname, "r") as f:
-            content = f.read()
+        tree = astcache.parse_file(fname)
     except FileNotFoundError:
         print("Error: File not found.")
         return -1
-
-    tree = ast.parse(content, filename=fname)
-    interpreter = SimpleProgramInterpreter()
+    if optimize:
+        for name, removed in runopt.optimize(tree, runopt.SIMPLE_INTERPRETER):
+            print(f"{name} removed {removed} nodes")
     try:
-        result = interpreter.evaluate(tree)
+        if interp:
+            result = SimpleProgramInterpreter().evaluate(tree)
+        else:
+            result = SimpleProgramCompiler().compile(tree)()
         print(f"The result is {result}")
         return 0
     except (NameError, TypeError, KeyError) as e:
@@ -184,10 +285,15 @@ def main():
         return do_cmp(sys.argv[2], sys.argv[3])
     elif len(sys.argv) == 4 and sys.argv[1] == "dst":
         return do_dst(sys.argv[2], sys.argv[3])
-    elif len(sys.argv) == 3 and sys.argv[1] == "run":
-        return do_run(sys.argv[2])
+    elif len(sys.argv) == 6 and sys.argv[1] == "dst" and sys.argv[2] == "--max":
+        return do_dst(sys.argv[4], sys.argv[5], max_dist=int(sys.argv[3]))
+    elif len(sys.argv) >= 3 and sys.argv[1] == "run" and set(sys.argv[2:-1]) <= {"--interp", "--optimize"}:
+        flags = sys.argv[2:-1]
+        return do_run(sys.argv[-1], interp="--interp" in flags, optimize="--optimize" in flags)
     else:
         print("Usage: python treeops.py <command> <file1.py> [file2.py]")
+        print("       python treeops.py dst --max <K> <file1.py> <file2.py>")
+        print("       python treeops.py run [--interp] [--optimize] <file1.py>")
         return -1
 
 
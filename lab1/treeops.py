@@ -1,94 +1,211 @@
 from platform import node
 import sys
+import os
 import ast
-import zss
-from zss import Node, simple_distance
+import csv
+import hashlib
+import operator
+import multiprocessing
+from zss import Node
+import ted
+import runopt
+import labpath  # puts the top of the repo, with the shared modules, on sys.path
+import astcache
 
 def main():
     if len(sys.argv) == 4 and sys.argv[1] == "cmp":
         return do_cmp(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 3 and sys.argv[1] == "cmp-all":
+        return do_cmp_all(sys.argv[2])
     elif len(sys.argv) == 4 and sys.argv[1] == "dst":
         return do_dst(sys.argv[2], sys.argv[3])
-    elif len(sys.argv) == 3 and sys.argv[1] == "run":
-        return do_run(sys.argv[2])
+    elif len(sys.argv) == 6 and sys.argv[1] == "dst" and sys.argv[2] == "--max":
+        return do_dst(sys.argv[4], sys.argv[5], max_dist=int(sys.argv[3]))
+    elif 3 <= len(sys.argv) <= 5 and sys.argv[1] == "dst-matrix":
+        outname = sys.argv[3] if len(sys.argv) > 3 else "dst_matrix.csv"
+        workers = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        return do_dst_matrix(sys.argv[2], outname, workers)
+    elif len(sys.argv) == 4 and sys.argv[1] == "index":
+        return do_index(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) in (4, 5) and sys.argv[1] == "similar":
+        k = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+        return do_similar(sys.argv[2], sys.argv[3], k)
+    elif len(sys.argv) >= 3 and sys.argv[1] == "run" and set(sys.argv[2:-1]) <= {"--interp", "--optimize"}:
+        flags = sys.argv[2:-1]
+        return do_run(sys.argv[-1], interp="--interp" in flags, optimize="--optimize" in flags)
+    elif len(sys.argv) >= 4 and sys.argv[1] == "run-batch":
+        optimize = sys.argv[2] == "--optimize"
+        args = sys.argv[3:] if optimize else sys.argv[2:]
+        if len(args) not in (2, 3):
+            print("Usage: python treeops.py run-batch [--optimize] <file> <inputs> <optional out>")
+            return -1
+        out_fname = args[2] if len(args) > 2 else None
+        return do_run_batch(args[0], args[1], out_fname, optimize=optimize)
     else:
         print("Usage: python treeops.py <cmd> <file 1> <optional file 2>")
+        print("       python treeops.py dst --max <K> <file 1> <file 2>")
+        print("       python treeops.py run [--interp] [--optimize] <file>")
+        print("       python treeops.py run-batch [--optimize] <file> <inputs .csv/.npz/.npy> <optional out .csv/.npy>")
+        print("       python treeops.py dst-matrix <dir> <optional out .csv/.npy> <optional workers>")
+        print("       python treeops.py index <dir> <index file>")
+        print("       python treeops.py similar <index file> <file> <optional k>")
         return -1
 
 # opening files
 
+def open_file(fname):
+    return astcache.parse_file(fname)
+
 def open_files(fname1, fname2):
-    with open(fname1, "r") as f1, open(fname2, "r") as f2:
-        file1 = f1.read()
-        file2 = f2.read()
-        tree1 = ast.parse(file1, filename=fname1)
-        tree2 = ast.parse(file2, filename=fname2)
-        return tree1,tree2
+    return open_file(fname1), open_file(fname2)
+
+
+# full recursive comparison of two ASTs
+def cmpASTs(node1, node2):
+    # Compare AST nodes
+    if isinstance(node1, ast.AST) and isinstance(node2, ast.AST):
+        if type(node1) is not type(node2):
+            return False
+        for (field, value) in ast.iter_fields(node1):
+            if not cmpASTs(value, getattr(node2, field)):
+                return False
+        return True
+    # Compare lists
+    if isinstance(node1, list) and isinstance(node2, list):
+        if len(node1) != len(node2):
+            return False
+        for a,b in zip(node1, node2):
+            if not cmpASTs(a, b):
+                return False
+        return True
+    # For strings/numbers
+    return node1 == node2
+
+
+# Merkle hash of every node: a node's digest covers its type, its scalar
+# fields and the digests of its children. ctx is skipped and positions are
+# attributes (not fields) so they never get hashed. Done iteratively so deep
+# trees don't hit the recursion limit. Returns {id(node): digest}.
+def structural_hashes(tree):
+    hashes = {}
+    stack = [(tree, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            for child in ast.iter_child_nodes(node):
+                if not isinstance(child, ast.expr_context):
+                    stack.append((child, False))
+            continue
+
+        h = hashlib.blake2b(type(node).__name__.encode(), digest_size=16)
+        for (field, value) in ast.iter_fields(node):
+            if field == "ctx":
+                continue
+            h.update(b"|" + field.encode() + b"=")
+            values = value if isinstance(value, list) else [value]
+            if isinstance(value, list):
+                h.update(b"[%d]" % len(value))
+            for v in values:
+                if isinstance(v, ast.AST):
+                    h.update(hashes[id(v)])
+                else:
+                    # keep the type so 1, 1.0 and True hash differently
+                    h.update(f"{type(v).__name__}:{v!r};".encode())
+        hashes[id(node)] = h.digest()
+    return hashes
+
+def structural_hash(tree):
+    return structural_hashes(tree)[id(tree)]
+
 
-        
 # Provide the solution to Exercise 2 by implementing the function below
 def do_cmp(fname1, fname2):
     # Generate ASTS
     tree1,tree2 = open_files(fname1, fname2)
 
-    def cmpASTs(node1, node2):
-        # Compare AST nodes
-        if isinstance(node1, ast.AST) and isinstance(node2, ast.AST):
-            if type(node1) is not type(node2):
-                return False
-            for (field, value) in ast.iter_fields(node1):
-                if not cmpASTs(value, getattr(node2, field)):
-                    return False
-            return True
-        # Compare lists
-        if isinstance(node1, list) and isinstance(node2, list):
-            if len(node1) != len(node2):
-                return False
-            for a,b in zip(node1, node2):
-                if not cmpASTs(a, b):
-                    return False
-            return True
-        # For strings/numbers
-        return node1 == node2
-    # Commpare ASTs of both files
-    if cmpASTs(tree1, tree2):
+    # Commpare ASTs of both files, the full walk only runs when the hashes match
+    if structural_hash(tree1) == structural_hash(tree2) and cmpASTs(tree1, tree2):
         print("The programs are identical")
     else:
         print("The programs are not identical")
 
-# Provide the solution to Exercise 3 by implementing the function below
-def do_dst(fname1, fname2):
-    tree1,tree2 = open_files(fname1, fname2)
+# groups the identical programs of a directory by their root hash
+def do_cmp_all(dirname):
+    buckets = {}
+    for fname in astcache.list_files(dirname):
+        try:
+            tree = open_file(fname)
+        except (SyntaxError, UnicodeDecodeError) as e:
+            print(f"Skipping {fname}: {e}")
+            continue
+        buckets.setdefault(structural_hash(tree), []).append((fname, tree))
 
-    # only counting name, constant and attr nodes
-    def node_label(node, include_values=True):
-        type_of_node = type(node).__name__
-        if not include_values:
-            return type_of_node
-        if isinstance(node, ast.Name):
-            return f"Name:{node.id}:{type(node.ctx).__name__}"
-        if isinstance(node, ast.Constant):
-            return f"Const:{repr(node.value)}"
-        if isinstance(node, ast.Attribute):
-            return f"Attribute:{node.attr}"
-        if isinstance(node, ast.arg):
-            return f"arg:{node.arg}"
+    # confirm each bucket with a full walk in case of a hash collision
+    groups = []
+    for bucket in buckets.values():
+        while len(bucket) > 1:
+            first_name, first_tree = bucket[0]
+            same = [first_name]
+            rest = []
+            for fname, tree in bucket[1:]:
+                if cmpASTs(first_tree, tree):
+                    same.append(fname)
+                else:
+                    rest.append((fname, tree))
+            if len(same) > 1:
+                groups.append(same)
+            bucket = rest
+
+    if not groups:
+        print("No identical programs found")
+        return 0
+    for i, group in enumerate(sorted(groups), start=1):
+        print(f"Group {i} ({len(group)} identical programs):")
+        for fname in group:
+            print(f"    {fname}")
+    return 0
+
+# only counting name, constant and attr nodes
+def node_label(node, include_values=True):
+    type_of_node = type(node).__name__
+    if not include_values:
         return type_of_node
+    if isinstance(node, ast.Name):
+        return f"Name:{node.id}:{type(node.ctx).__name__}"
+    if isinstance(node, ast.Constant):
+        return f"Const:{repr(node.value)}"
+    if isinstance(node, ast.Attribute):
+        return f"Attribute:{node.attr}"
+    if isinstance(node, ast.arg):
+        return f"arg:{node.arg}"
+    return type_of_node
+
+# iterating over children
+def node_children(node, ignore_ctx=True):
+    for c in ast.iter_child_nodes(node):
+        if ignore_ctx and isinstance(c, ast.expr_context):
+            continue
+        yield c
+
+# converting to the zss AST structure
+def ast_to_zss_tree(node, *, include_values=True, ignore_ctx=True):
+    z = Node(node_label(node, include_values))
+    for child in node_children(node, ignore_ctx):
+        z.addkid(ast_to_zss_tree(child, include_values=include_values, ignore_ctx=ignore_ctx))
+    return z
+
+# same labels and children as ast_to_zss_tree, straight into the postorder
+# tables ted works on
+def ast_to_postorder(tree):
+    return ted.PostorderTree.from_tree(tree, node_children, node_label)
+
+
+# Provide the solution to Exercise 3 by implementing the function below
+# with max_dist set we only care whether the distance is within max_dist
+def do_dst(fname1, fname2, max_dist=None):
+    tree1,tree2 = open_files(fname1, fname2)
 
-    # iterating over children
-    def node_children(node, ignore_ctx=True):
-        for c in ast.iter_child_nodes(node):
-            if ignore_ctx and isinstance(c, ast.expr_context):
-                continue
-            yield c
-
-    # converting to the zss AST structure
-    def ast_to_zss_tree(node, *, include_values=True, ignore_ctx=True):
-        z = Node(node_label(node, include_values))
-        for child in node_children(node, ignore_ctx):
-            z.addkid(ast_to_zss_tree(child, include_values=include_values, ignore_ctx=ignore_ctx))
-        return z
-    
     # counting the nodes to normalize
     def count_nodes(node: Node):
         # adding 1 caus when we start from root we skip the module node
@@ -99,19 +216,391 @@ def do_dst(fname1, fname2):
     node_sum_1 = count_nodes(z_tree_1)
     node_sum_2 = count_nodes(z_tree_2)
 
-    distance = simple_distance(z_tree_1, z_tree_2)
+    if max_dist is None:
+        distance = ted.simple_distance(z_tree_1, z_tree_2)
+    else:
+        # every insert/delete changes the node count by one, so the size
+        # difference alone can rule the pair out
+        distance = None
+        if abs(node_sum_1 - node_sum_2) <= max_dist:
+            t1 = ted.PostorderTree.from_tree(z_tree_1, Node.get_children, Node.get_label)
+            t2 = ted.PostorderTree.from_tree(z_tree_2, Node.get_children, Node.get_label)
+            distance = ted.bounded_distance(t1, t2, max_dist)
+        if distance is None:
+            print(f"The tree edit distance is > {max_dist}")
+            return
+        # a float like simple_distance's, so --max doesn't change the output
+        distance = float(distance)
     print(f"node sum for 1 is {node_sum_1}")
     print(f"node sum for 2 is {node_sum_2}")
     print(f"node sum for simple_distance is {distance}")
 
     print(f'The normalized tree edit distance is {distance / (node_sum_1 + node_sum_2)}')
 
+# postorder tables of every file, set once per worker by the pool initializer
+_matrix_trees = None
+
+def _init_matrix_worker(tables):
+    global _matrix_trees
+    _matrix_trees = [ted.PostorderTree(labels, lmds) for labels, lmds in tables]
+
+def _matrix_chunk(pairs):
+    return [(i, j, ted.distance(_matrix_trees[i], _matrix_trees[j])) for i, j in pairs]
+
+def write_matrix(outname, fnames, matrix):
+    if outname.endswith(".npy"):
+        import numpy as np
+        np.save(outname, np.array(matrix, dtype=np.float32))
+        # the .npy only holds numbers so print which row is which file
+        for i, fname in enumerate(fnames):
+            print(f"{i}: {fname}")
+        return
+    with open(outname, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow([""] + fnames)
+        for fname, row in zip(fnames, matrix):
+            writer.writerow([fname] + [f"{d:.6f}" for d in row])
+
+# normalized tree edit distance between every pair of files in a directory
+def do_dst_matrix(dirname, outname="dst_matrix.csv", workers=None):
+    # parse and convert every file once
+    fnames = []
+    tables = []
+    for fname in astcache.list_files(dirname):
+        try:
+            tree = open_file(fname)
+        except (SyntaxError, UnicodeDecodeError) as e:
+            print(f"Skipping {fname}: {e}")
+            continue
+        t = ast_to_postorder(tree)
+        fnames.append(fname)
+        tables.append((t.labels, t.lmds))
+
+    n = len(fnames)
+    pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+    workers = workers or os.cpu_count() or 1
+    # a few chunks per worker so one slow pair doesn't hold up the rest
+    size = max(1, len(pairs) // (workers * 4))
+    chunks = [pairs[k:k + size] for k in range(0, len(pairs), size)]
+
+    if workers == 1:
+        _init_matrix_worker(tables)
+        results = map(_matrix_chunk, chunks)
+    else:
+        pool = multiprocessing.Pool(workers, _init_matrix_worker, (tables,))
+        results = pool.imap_unordered(_matrix_chunk, chunks)
+
+    # every cell is written by index, so the order chunks finish in doesn't matter
+    matrix = [[0.0] * n for _ in range(n)]
+    for chunk in results:
+        for i, j, distance in chunk:
+            total = len(tables[i][0]) + len(tables[j][0])
+            matrix[i][j] = matrix[j][i] = distance / total
+    if workers != 1:
+        pool.close()
+        pool.join()
+
+    write_matrix(outname, fnames, matrix)
+    print(f"Wrote {n}x{n} distance matrix to {outname}")
+    return 0
+
+
+# pq-gram profile over the same labels dst uses
+def pq_profile(tree, index):
+    import pqgram
+    return pqgram.profile(tree, node_children, node_label, index.p, index.q)
+
+# builds the near-duplicate index of every file in a directory
+def do_index(dirname, index_name):
+    import pqgram
+    index = pqgram.PQGramIndex()
+    for fname in astcache.list_files(dirname):
+        try:
+            tree = open_file(fname)
+        except (SyntaxError, UnicodeDecodeError) as e:
+            print(f"Skipping {fname}: {e}")
+            continue
+        index.add(fname, pq_profile(tree, index))
+    index.save(index_name)
+    print(f"Indexed {len(index.names)} files into {index_name}")
+    return 0
+
+# k most similar indexed files, LSH candidates ranked by pq-gram distance and
+# the best of those reranked by the exact tree edit distance
+def do_similar(index_name, fname, k=10):
+    import pqgram
+    index = pqgram.PQGramIndex.load(index_name)
+    tree = open_file(fname)
+    t = ast_to_postorder(tree)
+
+    results = []
+    for other, _ in index.query(pq_profile(tree, index), 2 * k):
+        try:
+            other_t = ast_to_postorder(open_file(other))
+        except (OSError, SyntaxError, UnicodeDecodeError) as e:
+            print(f"Skipping {other}: {e}")
+            continue
+        distance = ted.distance(t, other_t)
+        results.append((distance / (len(t) + len(other_t)), other))
+    results.sort()
+
+    if not results:
+        print("No similar programs found")
+        return 0
+    for normalized, other in results[:k]:
+        print(f"{normalized:.4f}  {other}")
+    return 0
+
+
+# Closure compiler for the run language. It gives the same results as
+# calculate_ast but walks the tree only once: every node becomes a closure
+# and every variable a fixed slot in a list, so running the program again
+# does no dispatch and no dict lookups. Only the module body runs, in order,
+# so which names are bound at each load is already known at compile time.
+# inputs are names bound before the program starts, their values are passed
+# to the program in the same order.
+def compile_ast(tree, inputs=()):
+    # name -> slot, inputs first
+    slots = {name: i for i, name in enumerate(inputs)}
+    # assigned name -> slot, in first assignment order like the keys of
+    # temp_dict; inputs only count once the program assigns them
+    assigned = {}
+
+    def compile_expr(node):
+        if isinstance(node, ast.Constant):
+            value = node.value
+            return lambda env: value
+        elif isinstance(node, ast.Name):
+            name = node.id
+            if name not in slots:
+                def unbound(env):
+                    raise KeyError(name)
+                return unbound
+            i = slots[name]
+            return lambda env: env[i]
+        elif isinstance(node, ast.BinOp):
+            return compile_binop(node)
+        # calculate_ast gives None for anything else without looking inside
+        return lambda env: None
+
+    def compile_binop(node):
+        left, right = node.left, node.right
+        # the common leaf cases read the slot or constant directly
+        if isinstance(node.op, (ast.Add, ast.Sub, ast.Mult)) and is_leaf(left) and is_leaf(right):
+            f = ARITH_OPS[type(node.op)]
+            if isinstance(left, ast.Name) and isinstance(right, ast.Name):
+                i, j = slots[left.id], slots[right.id]
+                return lambda env: f(env[i], env[j])
+            if isinstance(left, ast.Name):
+                i, c = slots[left.id], right.value
+                return lambda env: f(env[i], c)
+            if isinstance(right, ast.Name):
+                c, j = left.value, slots[right.id]
+                return lambda env: f(c, env[j])
+        l = compile_expr(left)
+        r = compile_expr(right)
+        if isinstance(node.op, ast.Add):
+            return lambda env: l(env) + r(env)
+        elif isinstance(node.op, ast.Sub):
+            return lambda env: l(env) - r(env)
+        elif isinstance(node.op, ast.Mult):
+            return lambda env: l(env) * r(env)
+        # other operators still evaluate both sides, then give None
+        def unsupported(env):
+            l(env)
+            r(env)
+        return unsupported
+
+    # a bound name or a constant
+    def is_leaf(node):
+        return isinstance(node, ast.Constant) or (isinstance(node, ast.Name) and node.id in slots)
+
+    def compile_stmt(node):
+        if isinstance(node, ast.Assign):
+            target = node.targets[0]
+            if not isinstance(target, ast.Name):
+                def bad_target(env):
+                    return target.id  # AttributeError, same as calculate_ast
+                return bad_target
+            value = compile_expr(node.value)
+            # the slot only exists after the value, so `a = a + 1` stays unbound
+            i = slots.setdefault(target.id, len(slots))
+            assigned.setdefault(target.id, i)
+            def assign(env):
+                env[i] = value(env)
+            return assign
+        elif isinstance(node, ast.Expr):
+            return compile_expr(node.value)
+        # any other statement is skipped
+        return None
+
+    stmts = [c for c in map(compile_stmt, tree.body) if c is not None]
+    nslots = len(slots)
+    last = list(assigned.values())[-1] if assigned else None
+
+    # runs the program and returns the value of the name temp_dict got last
+    def program(*values):
+        env = [None] * nslots
+        env[:len(values)] = values
+        for stmt in stmts:
+            stmt(env)
+        if last is None:
+            # what list(temp_dict.keys())[-1] raises with no keys
+            raise IndexError("list index out of range")
+        return env[last]
+    return program
+
+ARITH_OPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul}
+
+# names the run language reads before assigning them, in first use order
+def free_names(tree):
+    bound = set()
+    free = []
+
+    def loads(node):
+        if isinstance(node, ast.Name):
+            if node.id not in bound and node.id not in free:
+                free.append(node.id)
+        elif isinstance(node, ast.BinOp):
+            loads(node.left)
+            loads(node.right)
+
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Assign):
+            loads(stmt.value)
+            if isinstance(stmt.targets[0], ast.Name):
+                bound.add(stmt.targets[0].id)
+        elif isinstance(stmt, ast.Expr):
+            loads(stmt.value)
+    return free
+
+# whether every int the program computes stays inside int64, given the
+# largest absolute value of each int input (interval arithmetic on |x|)
+def int64_safe(tree, bounds):
+    bounds = dict(bounds)
+    limit = 2**63 - 1
+    safe = True
+
+    # None once the value is not an int, floats behave the same in numpy
+    def bound(node):
+        nonlocal safe
+        if isinstance(node, ast.Constant):
+            b = abs(int(node.value)) if isinstance(node.value, int) else None
+        elif isinstance(node, ast.Name):
+            b = bounds.get(node.id)
+        elif isinstance(node, ast.BinOp):
+            left, right = bound(node.left), bound(node.right)
+            if left is None or right is None or type(node.op) not in ARITH_OPS:
+                b = None
+            elif isinstance(node.op, ast.Mult):
+                b = left * right
+            else:
+                b = left + right
+        else:
+            b = None
+        if b is not None and b > limit:
+            safe = False
+        return b
+
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Assign):
+            b = bound(stmt.value)
+            if isinstance(stmt.targets[0], ast.Name):
+                bounds[stmt.targets[0].id] = b
+        elif isinstance(stmt, ast.Expr):
+            bound(stmt.value)
+    return safe
+
+# input columns by name from a .csv with a header row, a .npz or a .npy
+# with named fields
+def load_columns(fname):
+    import numpy as np
+    if fname.endswith(".npz"):
+        with np.load(fname) as data:
+            return {name: data[name] for name in data.files}
+    if fname.endswith(".npy"):
+        data = np.load(fname)
+        if data.dtype.names is None:
+            raise ValueError(f"{fname} needs named fields to bind variables")
+        return {name: data[name] for name in data.dtype.names}
+
+    with open(fname, "r", newline="") as f:
+        rows = list(csv.reader(f))
+    columns = {}
+    for k, name in enumerate(rows[0]):
+        cells = [row[k].strip() for row in rows[1:]]
+        try:
+            values = [int(c) for c in cells]
+        except ValueError:
+            columns[name.strip()] = np.array([float(c) for c in cells])
+            continue
+        # ints that don't fit int64 stay python ints
+        fits = all(-2**63 <= v < 2**63 for v in values)
+        columns[name.strip()] = np.array(values, dtype=np.int64 if fits else object)
+    return columns
+
+# runs the program once over whole input columns: the free variables are
+# bound to arrays, so every BinOp is one elementwise numpy operation
+def do_run_batch(fname, data_fname, out_fname=None, optimize=False):
+    import numpy as np
+    tree = open_file(fname)
+    columns = load_columns(data_fname)
+
+    # free variables missing from the data stay unbound (KeyError as in run)
+    inputs = [name for name in free_names(tree) if name in columns]
+    values = [columns[name] for name in inputs]
+    # numpy adds bools as logical or, python as ints: keep python's rules
+    values = [v.astype(object) if v.dtype.kind == "b" else v for v in values]
+    # numpy computes in the column's own width and wraps, so bring narrower
+    # ints up to int64; uint64 values past int64 stay exact python ints
+    for i, v in enumerate(values):
+        if v.dtype.kind in "iu" and v.dtype != np.int64:
+            fits = v.dtype.kind == "i" or not v.size or int(v.max()) < 2**63
+            values[i] = v.astype(np.int64 if fits else object)
+    if optimize:
+        run_passes(tree, inputs)
+
+    # python ints never overflow, so fall back to exact object arrays
+    # whenever int64 could
+    bounds = {}
+    for name, v in zip(inputs, values):
+        if v.dtype.kind in "iu" and v.size:
+            bounds[name] = max(abs(int(v.min())), abs(int(v.max())))
+        elif v.dtype.kind in "iu":
+            bounds[name] = 0
+    if not int64_safe(tree, bounds):
+        values = [v.astype(object) if v.dtype.kind in "iu" else v for v in values]
+
+    program = compile_ast(tree, inputs)
+    nrows = len(values[0]) if values else 1
+    result = np.broadcast_to(np.asarray(program(*values)), (nrows,))
+
+    print(f"The result is {result}")
+    if out_fname is not None:
+        if out_fname.endswith(".npy"):
+            np.save(out_fname, result)
+        else:
+            np.savetxt(out_fname, result, fmt="%s")
+    return 0
+
+
+# optimizes the program in place and reports what every pass removed
+def run_passes(tree, inputs=()):
+    for name, removed in runopt.optimize(tree, runopt.CALCULATE_AST, inputs):
+        print(f"{name} removed {removed} nodes")
+
+
 # Provide the solution to Exercise 4 by implementing the function below
-def do_run(fname):
+# interp=True runs the original tree walking interpreter instead of compiling
+def do_run(fname, interp=False, optimize=False):
 
-    with open(fname, "r") as f1:
-        file1 = f1.read()
-        tree = ast.parse(file1, filename=fname)
+    tree = open_file(fname)
+    if optimize:
+        run_passes(tree)
+    if not interp:
+        program = compile_ast(tree)
+        print(f"The result is {program()}")
+        return
 
     # temp dict to store variables
     temp_dict = {}
@@ -1,17 +1,28 @@
 import sys
+import os
 import ast
 import re
+import json
+import hashlib
+import mmap
+import multiprocessing
+import labpath  # puts the top of the repo, with the shared modules, on sys.path
+import astcache
+import taint
+import constprop
+import dataflow
+import flow
+from flow import FlowGraph
 
 
 def open_file(fname):
-    with open(fname, "r") as f1:
-        file1 = f1.read()
-        tree = ast.parse(file1, filename=fname)
-        return tree
+    return astcache.parse_file(fname)
 
 
 def main():
-    if len(sys.argv) == 3 and sys.argv[1] == "unused":
+    if len(sys.argv) == 3 and sys.argv[1] in COMMANDS and is_many_files(sys.argv[2]):
+        return do_scan(sys.argv[1], sys.argv[2])
+    elif len(sys.argv) == 3 and sys.argv[1] == "unused":
         return do_unused(sys.argv[2])
     elif len(sys.argv) == 3 and sys.argv[1] == "returns":
         return do_returns(sys.argv[2])
@@ -21,212 +32,480 @@ def main():
         return do_secret(sys.argv[2])
     elif len(sys.argv) == 3 and sys.argv[1] == "taint":
         return do_taint(sys.argv[2])
+    elif len(sys.argv) == 5 and sys.argv[1] == "taint" and sys.argv[2] == "--config":
+        return do_taint(sys.argv[4], sys.argv[3])
+    elif len(sys.argv) == 3 and sys.argv[1] == "all":
+        return do_all(sys.argv[2])
     else:
-        print("Usage: python astanalysis.py <cmd> <file>")
+        print("Usage: python astanalysis.py <cmd> <file | dir | glob>")
+        print("       python astanalysis.py taint --config <taint.json> <file>")
         return -1
-    
+
+
+# Every analysis below is a checker. run_checkers walks the tree once, in the
+# same order as ast.NodeVisitor, and hands each node to every checker that has
+# an enter_<NodeType> method (before the children) or leave_<NodeType> method
+# (after them). The constant and taint checkers are not part of that walk:
+# they only keep the Module and run their own whole-module pass over it
+# (constprop.analyze, taint.analyze) when asked for messages.
+#
+# A checker that can tell from the raw bytes of a file that it has nothing
+# to report there overrides wants(); files no checker wants are not parsed.
+#
+# A message is a string, or (line, text) for checkers that can point at a
+# line; those print as file:line: text.
+class Checker:
+    def wants(self, data):
+        return True
+
+    def messages(self):
+        return []
+
+
+def has_prefilter(checkers):
+    return any(type(c).wants is not Checker.wants for c in checkers)
+
+
+# the checkers that want fname, looking at it through a memory map
+def prefilter_file(fname, checkers):
+    if not has_prefilter(checkers):
+        return checkers
+    with open(fname, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return [c for c in checkers if c.wants(b"")]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return [c for c in checkers if c.wants(data)]
+
+
+def run_checkers(tree, checkers):
+    handlers = {}
+
+    def lookup(node_type):
+        name = node_type.__name__
+        enter = [m for c in checkers if (m := getattr(c, "enter_" + name, None))]
+        leave = [m for c in checkers if (m := getattr(c, "leave_" + name, None))]
+        handlers[node_type] = (enter, leave)
+        return enter, leave
+
+    stack = [(tree, False)]
+    while stack:
+        node, done = stack.pop()
+        enter, leave = handlers.get(type(node)) or lookup(type(node))
+        if done:
+            for method in leave:
+                method(node)
+            continue
+        for method in enter:
+            method(node)
+        if leave:
+            stack.append((node, True))
+        for child in reversed(list(ast.iter_child_nodes(node))):
+            stack.append((child, False))
+    return [c.messages() for c in checkers]
+
+
+def format_message(fname, msg):
+    if isinstance(msg, str):
+        return msg
+    line, text = msg
+    return f"{fname}:{line}: {text}"
+
+
+def run_and_print(fname, checkers):
+    checkers = prefilter_file(fname, checkers)
+    if not checkers:
+        return
+    tree = open_file(fname)
+    for messages in run_checkers(tree, checkers):
+        for msg in messages:
+            print(format_message(fname, msg))
+
+
 # Exercise 1
+#
+# The traversal only records, per scope (module, class, function, lambda,
+# comprehension), which names the scope binds and which it loads. messages()
+# then walks the scope tree once keeping, for every name, the stack of open
+# scopes that bind it, so both "does an enclosing scope bind this" and "which
+# binding does this load see" are a dict lookup. Python's rules: a name bound
+# anywhere in a scope is local to all of it, and class bodies are not visible
+# from the functions nested in them.
+class VarUsageAnalyzer(Checker):
+    comprehension_names = {"ListComp": "<listcomp>", "SetComp": "<setcomp>",
+                           "DictComp": "<dictcomp>", "GeneratorExp": "<genexpr>"}
+
+    def __init__(self):
+        self.scopes = []
+        self.scope_stack = []
+        self.skip = set()  # Name nodes that aren't plain bindings
+        self.walrus = {}  # Name node of a := inside a comprehension -> scope
+
+    def open_scope(self, kind, name):
+        parent = self.scope_stack[-1] if self.scope_stack else None
+        scope = {"name": name, "kind": kind, "children": [],
+                 "vars": {}, "loads": set(), "declared": set()}
+        if parent is not None:
+            self.scopes[parent]["children"].append(len(self.scopes))
+        self.scope_stack.append(len(self.scopes))
+        self.scopes.append(scope)
+
+    def close_scope(self, node):
+        self.scope_stack.pop()
+
+    # reported: whether it is a variable that should be read at some point
+    # (not a parameter, import or def)
+    def bind(self, name, reported, scope=None):
+        scope = self.scopes[self.scope_stack[-1] if scope is None else scope]
+        scope["vars"][name] = scope["vars"].get(name, False) or reported
+
+    def enter_Module(self, node):
+        self.open_scope("module", "<module>")
+
+    def enter_FunctionDef(self, node):
+        self.bind(node.name, False)
+        self.open_scope("function", node.name)
+
+    def enter_ClassDef(self, node):
+        self.bind(node.name, False)
+        self.open_scope("class", node.name)
+
+    def enter_Lambda(self, node):
+        self.open_scope("function", "<lambda>")
+
+    def enter_comprehension_scope(self, node):
+        self.open_scope("comprehension", self.comprehension_names[type(node).__name__])
+
+    enter_AsyncFunctionDef = enter_FunctionDef
+    enter_ListComp = enter_SetComp = enter_DictComp = enter_GeneratorExp = enter_comprehension_scope
+    leave_Module = leave_FunctionDef = leave_AsyncFunctionDef = leave_ClassDef = close_scope
+    leave_Lambda = leave_ListComp = leave_SetComp = leave_DictComp = leave_GeneratorExp = close_scope
+
+    def enter_arg(self, node):
+        self.bind(node.arg, False)
+
+    def enter_Import(self, node):
+        for alias in node.names:
+            if alias.name != "*":
+                self.bind(alias.asname or alias.name.split(".")[0], False)
+
+    enter_ImportFrom = enter_Import
+
+    def enter_Global(self, node):
+        self.scopes[self.scope_stack[-1]]["declared"].update(node.names)
+
+    enter_Nonlocal = enter_Global
+
+    def enter_AnnAssign(self, node):
+        # a bare annotation makes the name local without assigning it
+        if node.value is None and isinstance(node.target, ast.Name):
+            self.skip.add(id(node.target))
+            self.bind(node.target.id, False)
+
+    def enter_AugAssign(self, node):
+        if isinstance(node.target, ast.Name):
+            self.scopes[self.scope_stack[-1]]["loads"].add(node.target.id)
+
+    def enter_NamedExpr(self, node):
+        # := in a comprehension binds in the enclosing function
+        for s in reversed(self.scope_stack):
+            if self.scopes[s]["kind"] != "comprehension":
+                self.walrus[id(node.target)] = s
+                break
+
+    def enter_ExceptHandler(self, node):
+        if node.name:
+            self.bind(node.name, True)
+
+    def enter_MatchAs(self, node):
+        if node.name:
+            self.bind(node.name, True)
+
+    enter_MatchStar = enter_MatchAs
+
+    def enter_MatchMapping(self, node):
+        if node.rest:
+            self.bind(node.rest, True)
+
+    def enter_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Store):
+            if id(node) not in self.skip:
+                self.bind(node.id, True, self.walrus.pop(id(node), None))
+        else:  # variable read (or del)
+            self.scopes[self.scope_stack[-1]]["loads"].add(node.id)
+
+    def messages(self):
+        if not self.scopes:
+            return []
+        msgs = []
+        visible = {}  # name -> open non-class scopes binding it, innermost last
+        used = set()  # (scope, name) pairs some load resolves to
+        stack = [(0, False)]
+        while stack:
+            s, done = stack.pop()
+            scope = self.scopes[s]
+            local = [v for v in scope["vars"] if v not in scope["declared"]]
+            if done:
+                if scope["kind"] != "class":
+                    for v in local:
+                        visible[v].pop()
+                if scope["kind"] in ("function", "comprehension"):
+                    for v in local:
+                        if scope["vars"][v] and (s, v) not in used and not v.startswith("_"):
+                            msgs.append(f"Variable {v} is defined but not used in scope {scope['name']}")
+                continue
+
+            for v in scope["loads"]:
+                if v in scope["vars"] and v not in scope["declared"]:
+                    used.add((s, v))
+                elif visible.get(v):
+                    used.add((visible[v][-1], v))
+            for v in local:
+                outer = visible.get(v)
+                if outer and self.scopes[outer[-1]]["kind"] != "module":
+                    msgs.append("Variable " + v + " is shadowed across scopes")
+            if scope["kind"] != "class":
+                for v in local:
+                    visible.setdefault(v, []).append(s)
+
+            stack.append((s, True))
+            for child in reversed(scope["children"]):
+                stack.append((child, False))
+        return msgs
+
+
 def do_unused(fname):
+    run_and_print(fname, [VarUsageAnalyzer()])
+
 
-    tree = open_file(fname)
 
-    class VarUsageAnalyzer(ast.NodeVisitor):
-        def __init__(self):
-            self.scope_stack = []
-            self.messages = []
-
-        def visit_FunctionDef(self, node: ast.FunctionDef):
-            current_scope = {"name": node.name, "vars": {}}
-            self.scope_stack.append(current_scope)
-            self.generic_visit(node)
-            scope = self.scope_stack.pop()
-            for v, st in scope["vars"].items():
-                if st["defined"] and not st["used"]:
-                    self.messages.append(
-                        f"Variable {v} is defined but not used in scope {scope['name']}"
-                    )
-
-        def visit_Assign(self, node: ast.Assign):
-            for target in node.targets:
-                if isinstance(target, ast.Name):
-                    varname = target.id
-                    if self.scope_stack:
-                        scope = self.scope_stack[-1]
-                        for outer in self.scope_stack[:-1]:
-                            if varname in outer["vars"]:
-                                self.messages.append("Variable " + varname + " is shadowed across scopes")
-
-                        scope["vars"].setdefault(varname, {"defined": True, "used": False})
-            self.generic_visit(node)
-
-        def visit_Name(self, node: ast.Name):
-            if isinstance(node.ctx, ast.Load):  # variable read
-                for scope in reversed(self.scope_stack):
-                    if node.id in scope["vars"]:
-                        scope["vars"][node.id]["used"] = True
-                        break
-            self.generic_visit(node)
-
-        def report(self):
-            for msg in self.messages:
-                print(msg)
-            
-    analyzer = VarUsageAnalyzer()
-    analyzer.visit(tree)
-    analyzer.report()
-
-
-       
 # Exercise 2
-def do_returns(fname):
+# A function is missing a return when the end of its body can be reached on
+# its flow graph (flow.py) without going through a return or a raise. That
+# takes loops, try/except/finally and match into account, and a literal
+# `while True:` never falls out of the bottom.
+class ReturnChecker(Checker):
+    def __init__(self):
+        self.msgs = []
 
-    tree = open_file(fname)
-    class ReturnChecker(ast.NodeVisitor):
-        def __init__(self):
-            self.messages = []
-
-        def visit_FunctionDef(self, node: ast.FunctionDef):
-            if not self.contains_return(node.body):
-                self.messages.append(
-                    f"Function {node.name} is missing a return statement"
-                )
-
-            self.check_block(node.body, node.name)
-            self.generic_visit(node)
-
-        def check_block(self, stmts, funcname):
-            for stmt in stmts:
-                if isinstance(stmt, ast.If):
-                    has_ret_if = self.contains_return(stmt.body)
-                    has_ret_else = self.contains_return(stmt.orelse)
-
-                    if not has_ret_if or not has_ret_else:
-                        self.messages.append(
-                            f"Function {funcname} is missing a return statement"
-                        )
-                    self.check_block(stmt.body, funcname)
-                    self.check_block(stmt.orelse, funcname)
-
-        def contains_return(self, stmts):
-            for st in stmts:
-                if isinstance(st, ast.Return):
-                    return True
-                if isinstance(st, ast.If):
-                    if self.contains_return(st.body) or self.contains_return(st.orelse):
-                        return True
-            return False
-        
-    checker = ReturnChecker()
-    checker.visit(tree)
-    for msg in checker.messages:
-        print(msg)
+    def enter_FunctionDef(self, node: ast.FunctionDef):
+        if FlowGraph(node.body).falls_through():
+            self.msgs.append(
+                f"Function {node.name} is missing a return statement"
+            )
 
+    enter_AsyncFunctionDef = enter_FunctionDef
 
+    def messages(self):
+        return self.msgs
 
 
-# Exercise 3
-def do_constant(fname):
-    # python astanalysis.py constant test.py
+def do_returns(fname):
+    run_and_print(fname, [ReturnChecker()])
 
-    tree = open_file(fname)
-    
-    for node in ast.walk(tree):
-        if isinstance(node, ast.If):
 
-            # constant condition
-            if isinstance(node.test, ast.Constant):
-                print("Conditional statement with constant condition detected")
 
 
-            # check comparison
-            elif isinstance(node.test, ast.Compare):
-                lhs_rhs = [node.test.left] + node.test.comparators
+# Exercise 3
+class ConstantChecker(Checker):
+    # python astanalysis.py constant test.py
+    # conditions constant after propagation, and the code they cut off; the
+    # propagation itself lives in constprop.py and is a whole-module pass of
+    # its own, this only hands it the tree
+    def __init__(self):
+        self.tree = None
 
-                if all(isinstance(val, ast.Constant) for val in lhs_rhs):
+    def enter_Module(self, node):
+        self.tree = node
 
-                    print("Conditional statement with constant condition detected")
+    def messages(self):
+        if self.tree is None:
+            return []
+        return constprop.analyze(self.tree)
 
+
+def do_constant(fname):
+    run_and_print(fname, [ConstantChecker()])
     return 0
 
 
 # Exercise 4
-def do_secret(fname):
-
+class SecretChecker(Checker):
     variable_name_regex = re.compile(r"(secret|password|key|token)")
 
     variable_value_regex =  re.compile(r"^WOWSECRET_\d{2,5}_[A-Z]{4}$")
 
-    tree = open_file(fname)
-    variables = {}
-    sus_variables = {}
-    def get_unique_load_variables(tree_node_pointer): 
+    # the same two patterns on raw bytes, a file has to contain both to be
+    # worth parsing (a value spelled with escapes or split over implicit
+    # string concatenation gets past this, as it never could before either)
+    value_bytes_regex = re.compile(rb"WOWSECRET_\d{2,5}_[A-Z]{4}")
+    name_bytes_regex = re.compile(rb"secret|password|key|token")
+
+    def __init__(self):
+        self.found = []
+
+    def wants(self, data):
+        # the value is the rare one, most files stop after that scan
+        return bool(self.value_bytes_regex.search(data) and self.name_bytes_regex.search(data))
+
+    def check(self, kind, target, value, node):
+        if not (isinstance(value, ast.Constant) and isinstance(value.value, str)):
+            return
+        if self.variable_name_regex.search(target) and self.variable_value_regex.search(value.value):
+            self.found.append((node.lineno, node.col_offset,
+                               f"{kind} {target} assigned possible secret {value.value}"))
+
+    # pairs up a, b = "x", "y" element by element
+    def check_target(self, target, value, node):
+        if isinstance(target, (ast.Tuple, ast.List)):
+            if isinstance(value, (ast.Tuple, ast.List)) and len(value.elts) == len(target.elts) \
+                    and not any(isinstance(e, ast.Starred) for e in target.elts + value.elts):
+                for t, v in zip(target.elts, value.elts):
+                    self.check_target(t, v, t)
+        elif isinstance(target, (ast.Name, ast.Attribute, ast.Subscript)):
+            self.check("Variable", ast.unparse(target), value, node)
+
+    def enter_Assign(self, node):
+        for target in node.targets:
+            self.check_target(target, node.value, node)
+
+    def enter_AnnAssign(self, node):
+        if node.value is not None:
+            self.check_target(node.target, node.value, node)
+
+    def enter_keyword(self, node):
+        if node.arg is not None:
+            self.check("Keyword argument", node.arg, node.value, node)
 
-        
-        for node in ast.walk(tree_node_pointer):
-            if isinstance(node, ast.Assign):
-                if isinstance(node.targets[0], ast.Name):
-                    varname = node.targets[0].id
-                    if isinstance(node.value, ast.Constant):
-                        variables[varname] = node.value.value
-                        
-    get_unique_load_variables(tree)
+    def messages(self):
+        return [msg for _, _, msg in sorted(self.found, key=lambda f: f[:2])]
 
-    for key,val in variables.items():
-        if variable_name_regex.search(key) and variable_value_regex.search(val):
-            sus_variables[key] = val
 
-    if sus_variables:
-        for key,val in sus_variables.items():
-            print(f"Variable {key} assigned possible secret {val}")
+def do_secret(fname):
+    run_and_print(fname, [SecretChecker()])
 
 
 # Exercise 5
-def do_taint(fname):
-    # python astanalysis.py taint test.py
-    tree = open_file(fname)
+class TaintChecker(Checker):
+    # python astanalysis.py taint [--config taint.json] test.py
+    # the dataflow itself lives in taint.py and is a whole-module pass of its
+    # own, this only hands it the tree
+    def __init__(self, config=None):
+        self.config = config
+        self.tree = None
+
+    def enter_Module(self, node):
+        self.tree = node
+
+    def messages(self):
+        if self.tree is None:
+            return []
+        return ["Unsafe data flow between source and sink detected"
+                for call in taint.analyze(self.tree, self.config)]
+
+
+def do_taint(fname, config_fname=None):
+    config = taint.TaintConfig.load(config_fname) if config_fname else None
+    run_and_print(fname, [TaintChecker(config)])
+    return 0
+
+
+# every checker, in the order of the commands
+CHECKERS = [VarUsageAnalyzer, ReturnChecker, ConstantChecker, SecretChecker, TaintChecker]
 
-    tainted = {} # keep track of tainted variables
-    danger = False # boolean to track unsafe data flows
-
-    def is_tainted(node):
-        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
-            # Test functions
-            if node.func.id == "input":
-                return True
-            if node.func.id == "sanitized": # always untainted
-                return False
-            # Check arguments
-            return any(is_tainted(arg) for arg in node.args)
-        
-        # Tracking binary operations
-        if isinstance(node, ast.BinOp):
-            # test both sides of operation
-            return is_tainted(node.left) or is_tainted(node.right)
-        
-        # Tracking variables
-        if isinstance(node, ast.Name):
-            return tainted.get(node.id, False)
-        
-        return False
-
-    # For any assignments
-    for node in ast.walk(tree):
-        # update any tainted vars through assignments
-        if isinstance(node, ast.Assign):
-            if isinstance(node.targets[0], ast.Name):
-                tainted[node.targets[0].id] = is_tainted(node.value)
-    
-    # Check os.system calls for taints
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
-                if node.func.attr == "system":
-                    if isinstance(node.func.value, ast.Name):
-                        if node.func.value.id == "os":
-                            for arg in node.args:
-                                if is_tainted(arg):
-                                    print("Unsafe data flow between source and sink detected")
-                                    danger = True
+
+# all the analyses above from one parse: one shared traversal for the
+# checkers with enter/leave methods, plus the constant and taint passes
+def do_all(fname):
+    run_and_print(fname, [checker() for checker in CHECKERS])
     return 0
 
+
+# --- Project-wide scanning ---
+#
+# A directory or glob is fanned out to a process pool. Results are cached on
+# disk per file content hash and analyzer version, one JSON file per
+# content holding the messages of every checker that ran on it, so a rescan
+# only parses the files that changed (or asks for a checker not yet cached).
+
+COMMANDS = {
+    "unused": [VarUsageAnalyzer],
+    "returns": [ReturnChecker],
+    "constant": [ConstantChecker],
+    "secret": [SecretChecker],
+    "taint": [TaintChecker],
+    "all": CHECKERS,
+}
+
+CACHE_DIR = ".astanalysis_cache"
+
+
+# the analyzers' own source, so any change to the checks drops old results
+def analyzer_version():
+    h = hashlib.sha256()
+    for module in (__file__, taint.__file__, constprop.__file__, flow.__file__, dataflow.__file__):
+        with open(module, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def is_many_files(path):
+    return os.path.isdir(path) or any(c in path for c in "*?[")
+
+
+def scan_file(job):
+    fname, checker_names, version, cache_dir = job
+    with open(fname, "rb") as f:
+        source = f.read()
+    digest = hashlib.sha256(source).hexdigest()
+    cache_file = os.path.join(cache_dir, f"{version}-{digest}.json")
+
+    cached = {}
+    if os.path.exists(cache_file):
+        with open(cache_file, "r") as f:
+            cached = json.load(f)
+    missing = [name for name in checker_names if name not in cached]
+    if not missing:
+        return fname, [cached[name] for name in checker_names], True
+
+    checkers = [globals()[name]() for name in missing]
+    wanted = [c for c in checkers if c.wants(source)]
+    for c in checkers:
+        if c not in wanted:
+            cached[type(c).__name__] = []
+    if wanted:
+        try:
+            tree = open_file(fname)
+        except (SyntaxError, ValueError) as e:
+            return fname, [[f"Could not parse: {e}"]], False
+        for c, messages in zip(wanted, run_checkers(tree, wanted)):
+            cached[type(c).__name__] = messages
+
+    # write then rename, another worker may have the same content
+    tmp = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(cached, f)
+    os.replace(tmp, cache_file)
+    return fname, [cached[name] for name in checker_names], False
+
+
+def do_scan(cmd, path, cache_dir=CACHE_DIR, workers=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    version = analyzer_version()
+    checker_names = [checker.__name__ for checker in COMMANDS[cmd]]
+    jobs = [(fname, checker_names, version, cache_dir) for fname in astcache.list_files(path)]
+
+    hits = 0
+    with multiprocessing.Pool(workers) as pool:
+        # imap keeps the file order stable whatever finishes first
+        for fname, results, hit in pool.imap(scan_file, jobs, chunksize=16):
+            hits += hit
+            for messages in results:
+                for msg in messages:
+                    text = format_message(fname, msg)
+                    print(f"{fname}: {text}" if isinstance(msg, str) else text)
+    print(f"Scanned {len(jobs)} files ({hits} cached, {len(jobs) - hits} analyzed)")
+    return 0
+
+
 if __name__ == "__main__":
     main()
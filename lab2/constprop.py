@@ -0,0 +1,533 @@
+import ast
+import operator
+from collections import deque
+import dataflow
+from flow import FlowGraph, node_exprs, pattern_names
+
+# Sparse conditional constant propagation (Wegman and Zadeck) for
+# `astanalysis.py constant`.
+#
+# Every scope (the module, each class body and each function) is analyzed on
+# its own flow graph (flow.py), put in SSA form first: one value per store,
+# and a phi where stores from different paths meet (minimal SSA, from the
+# Cooper-Harvey-Kennedy dominators and their frontiers, in dataflow.py). Each value goes
+# from TOP (not computed yet) to a constant to UNKNOWN, never back. Blocks
+# are only visited once an executable edge reaches them, and the edges out
+# of a test whose value is known are executable only on the side the test
+# takes, so stores behind a constant branch never reach the phis.
+#
+# Work is driven by two worklists, edges that became executable and values
+# that changed, and a change only revisits the values and tests using it.
+# Every value changes at most twice, so the solver stays close to linear in
+# the size of the scope. The results are the tests whose truth is the same
+# on every execution, and the blocks that no executable edge reaches
+# although the plain graph does (the code those tests cut off).
+
+UNKNOWN = object()
+
+# folded values bigger than this are left unknown rather than computed
+MAX_SIZE = 4096
+
+BINOPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+          ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+          ast.Pow: operator.pow, ast.LShift: operator.lshift, ast.RShift: operator.rshift,
+          ast.BitOr: operator.or_, ast.BitXor: operator.xor, ast.BitAnd: operator.and_}
+UNARYOPS = {ast.Not: operator.not_, ast.USub: operator.neg, ast.UAdd: operator.pos,
+            ast.Invert: operator.invert}
+CMPOPS = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+          ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Is: operator.is_,
+          ast.IsNot: operator.is_not, ast.In: lambda a, b: a in b,
+          ast.NotIn: lambda a, b: a not in b}
+
+# only immutable values are tracked, anything else can change behind a name
+CONSTANT_TYPES = (int, float, complex, str, bytes, bool, type(None), tuple)
+
+
+def _small(value):
+    if isinstance(value, int):
+        return value.bit_length() <= MAX_SIZE * 8
+    if isinstance(value, (str, bytes, tuple)):
+        return len(value) <= MAX_SIZE
+    return True
+
+
+def _too_big(op, left, right):
+    if op is ast.Pow and isinstance(left, int) and isinstance(right, int):
+        return right > 0 and left.bit_length() * right > MAX_SIZE * 8
+    if op is ast.LShift and isinstance(right, int):
+        return right > MAX_SIZE * 8
+    if op is ast.Mult:
+        for seq, times in ((left, right), (right, left)):
+            if isinstance(seq, (str, bytes, tuple)) and isinstance(times, int):
+                return len(seq) * times > MAX_SIZE
+    return False
+
+
+def same(a, b):
+    # 1, 1.0 and True compare equal but don't behave the same
+    return type(a) is type(b) and (a is b or a == b)
+
+
+def evaluate(expr, env):
+    """Value of expr when every name in env holds its value, or UNKNOWN."""
+    try:
+        return _evaluate(expr, env)
+    except RecursionError:
+        # left to the parser's nesting, a very deep expression just isn't folded
+        return UNKNOWN
+
+
+def _evaluate(expr, env):
+    if isinstance(expr, ast.Constant):
+        return expr.value
+    if isinstance(expr, ast.Name):
+        return env.get(expr.id, UNKNOWN)
+    if isinstance(expr, ast.NamedExpr):
+        return _evaluate(expr.value, env)
+    if isinstance(expr, ast.BoolOp):
+        # the truth of x and False is known even when x isn't
+        truths = [truth(v, env) for v in expr.values]
+        stop = isinstance(expr.op, ast.Or)
+        values = []
+        for v, t in zip(expr.values, truths):
+            if t is UNKNOWN:
+                break
+            values.append(_evaluate(v, env))
+            if t == stop:
+                return values[-1]
+        if len(values) == len(expr.values):
+            return values[-1]
+        return UNKNOWN
+    if isinstance(expr, ast.IfExp):
+        t = truth(expr.test, env)
+        if t is UNKNOWN:
+            return UNKNOWN
+        return _evaluate(expr.body if t else expr.orelse, env)
+    if isinstance(expr, ast.Tuple):
+        values = tuple(_evaluate(e, env) for e in expr.elts)
+        return UNKNOWN if any(v is UNKNOWN for v in values) else values
+    if isinstance(expr, ast.UnaryOp):
+        value = _evaluate(expr.operand, env)
+        return _apply(UNARYOPS[type(expr.op)], value)
+    if isinstance(expr, ast.BinOp):
+        op = type(expr.op)
+        left = _evaluate(expr.left, env)
+        right = _evaluate(expr.right, env)
+        if op not in BINOPS or right is UNKNOWN or _too_big(op, left, right):
+            return UNKNOWN
+        return _apply(BINOPS[op], left, right)
+    if isinstance(expr, ast.Compare):
+        left = _evaluate(expr.left, env)
+        for op, comparator in zip(expr.ops, expr.comparators):
+            right = _evaluate(comparator, env)
+            result = _apply(CMPOPS[type(op)], left, right)
+            if result is UNKNOWN or not result:
+                return result
+            left = right
+        return True
+    return UNKNOWN
+
+
+# op(*args), UNKNOWN when an argument is, or when it would raise at run time
+def _apply(op, *args):
+    if any(a is UNKNOWN for a in args):
+        return UNKNOWN
+    try:
+        value = op(*args)
+    except Exception:
+        return UNKNOWN
+    if not isinstance(value, CONSTANT_TYPES) or not _small(value):
+        return UNKNOWN
+    return value
+
+
+def truth(expr, env):
+    """True or False when expr's truth value is known, else UNKNOWN."""
+    if isinstance(expr, ast.BoolOp):
+        truths = [truth(v, env) for v in expr.values]
+        deciding = isinstance(expr.op, ast.Or)
+        if deciding in truths:
+            return deciding
+        return (not deciding) if UNKNOWN not in truths else UNKNOWN
+    if isinstance(expr, ast.UnaryOp) and isinstance(expr.op, ast.Not):
+        t = truth(expr.operand, env)
+        return UNKNOWN if t is UNKNOWN else not t
+    value = evaluate(expr, env)
+    return UNKNOWN if value is UNKNOWN else bool(value)
+
+
+TOP = object()  # no value seen yet; UNKNOWN is the bottom of the lattice
+
+
+def _meet(a, b):
+    if a is TOP:
+        return b
+    if b is TOP or (a is not UNKNOWN and b is not UNKNOWN and same(a, b)):
+        return a
+    return UNKNOWN
+
+
+# Names a store binds and, for each, the expression it gets and the path of
+# tuple indexes into that expression's value (None when the value can't be
+# followed, like a starred unpack).
+def _target_defs(target, expr, path, out):
+    if isinstance(target, ast.Name):
+        out.append((target.id, (expr, path) if expr is not None else None))
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        if any(isinstance(elt, ast.Starred) for elt in target.elts):
+            expr = None
+        for i, elt in enumerate(target.elts):
+            _target_defs(elt, expr, path + (i,), out)
+    elif isinstance(target, ast.Starred):
+        _target_defs(target.value, None, path, out)
+
+
+class ScopeConstants:
+    """SCCP of one scope's body.
+
+    The flow graph's blocks are put in SSA form: a value per store and a phi
+    per name where stores from different paths meet. The solver then
+    lowers values TOP -> constant -> UNKNOWN and marks edges executable,
+    revisiting only the users of a value that changed and the phis behind
+    an edge that just became executable.
+    """
+
+    def __init__(self, body, excluded=frozenset()):
+        self.graph = FlowGraph(body)
+        self.nodes = self.graph.nodes
+        # names something outside the scope's own flow may rebind
+        self.excluded = excluded
+        self._build_ssa()
+        self._solve()
+
+    # --- SSA construction ---
+
+    def _defs(self, n, walrus):
+        kind, node, _ = self.nodes[n]
+        defs = []
+        if kind == "for":
+            _target_defs(node.target, None, (), defs)
+        elif kind == "with":
+            for item in node.items:
+                if item.optional_vars is not None:
+                    _target_defs(item.optional_vars, None, (), defs)
+        elif kind == "handler":
+            if node.name:
+                defs.append((node.name, None))
+        elif kind == "case":
+            defs += [(name, None) for name in pattern_names(node.pattern)]
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                _target_defs(target, node.value, (), defs)
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            _target_defs(node.target, node.value, (), defs)
+        elif isinstance(node, ast.AugAssign):
+            if isinstance(node.target, ast.Name):
+                name = node.target.id
+                defs.append((name, (ast.BinOp(ast.Name(name, ast.Load()), node.op, node.value), ())))
+        elif isinstance(node, ast.Delete):
+            for target in node.targets:
+                _target_defs(target, None, (), defs)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defs.append((node.name, None))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            defs += [((a.asname or a.name).split(".")[0], None) for a in node.names]
+        defs += [(sub.target.id, (sub.value, ())) for sub in walrus]
+        return [(name, spec) for name, spec in defs if name not in self.excluded]
+
+    # the names a flow node's expressions read, and the assignment
+    # expressions in them
+    def _reads(self, n):
+        kind, node, _ = self.nodes[n]
+        names = set()
+        walrus = []
+        for expr in node_exprs(kind, node):
+            for sub in ast.walk(expr):
+                if isinstance(sub, ast.Name):
+                    names.add(sub.id)
+                elif isinstance(sub, ast.NamedExpr):
+                    walrus.append(sub)
+        return names, walrus
+
+    def _build_ssa(self):
+        graph = self.graph
+        count = len(graph.blocks)
+        entry = count  # a block of its own in front of the scope's entries
+        succs = [list(s) for s in graph.block_succs] + [
+            sorted({graph.block_of[n] for n in graph.entries})]
+        preds = [list(p) for p in graph.block_preds] + [[]]
+        for b in succs[entry]:
+            preds[b].append(entry)
+        self.succs, self.preds, self.entry = succs, preds, entry
+
+        order = self._reverse_postorder()
+        idom = dataflow.dominators(preds, order)
+        frontier = dataflow.dominance_frontiers(preds, idom)
+
+        node_reads = {}
+        node_defs = {}
+        def_blocks = {}
+        for b in order[1:]:
+            for n in graph.blocks[b]:
+                node_reads[n] = names, walrus = self._reads(n)
+                node_defs[n] = self._defs(n, walrus)
+                for name, _ in node_defs[n]:
+                    def_blocks.setdefault(name, set()).add(b)
+
+        # values: 0 is the unknown value every name has on entry; then
+        # ("expr", expr, path, reads) and ("phi", block, {pred: value})
+        self.values = [("unknown",)]
+        self.value_block = [entry]
+        self.value_users = [[]]  # values computed from each value
+        self.test_users = [[]]  # blocks whose branch tests each value
+        self.phis = {b: [] for b in order}
+        for name, blocks in def_blocks.items():
+            work = list(blocks)
+            placed = set()
+            while work:
+                b = work.pop()
+                for d in frontier[b]:
+                    if d not in placed:
+                        placed.add(d)
+                        self.phis[d].append((name, self._new_value(("phi", d, {}), d)))
+                        if d not in blocks:
+                            work.append(d)
+
+        self.block_values = {b: [] for b in order}
+        self.test_reads = {}
+
+        children = {b: [] for b in order}
+        for b in order[1:]:
+            children[idom[b]].append(b)
+        current = {}  # name -> stack of values
+        pushed = {}  # block -> names it pushed a value for
+        stack = [(entry, False)]
+        while stack:
+            b, done = stack.pop()
+            if done:
+                for name in pushed.pop(b):
+                    current[name].pop()
+                continue
+            pushed[b] = []
+            for name, v in self.phis[b]:
+                current.setdefault(name, []).append(v)
+                pushed[b].append(name)
+            for n in graph.blocks[b] if b != entry else ():
+                names, walrus = node_reads[n]
+                # a walrus target may change halfway through the expression
+                changing = {sub.target.id for sub in walrus}
+                reads = {name: (current[name][-1] if current.get(name) and name not in changing else 0)
+                         for name in names if name not in self.excluded}
+                if self.nodes[n][0] == "test":
+                    self.test_reads[n] = reads
+                    for v in set(reads.values()):
+                        self.test_users[v].append(b)
+                new = []
+                for name, spec in node_defs[n]:
+                    if spec is None:
+                        new.append((name, 0))
+                        continue
+                    v = self._new_value(("expr", spec[0], spec[1], reads), b)
+                    self.block_values[b].append(v)
+                    for r in set(reads.values()):
+                        self.value_users[r].append(v)
+                    new.append((name, v))
+                # every right-hand side is evaluated before any store happens
+                for name, v in new:
+                    current.setdefault(name, []).append(v)
+                    pushed[b].append(name)
+            for s in succs[b]:
+                for name, v in self.phis[s]:
+                    operand = current[name][-1] if current.get(name) else 0
+                    self.values[v][2][b] = operand
+                    self.value_users[operand].append(v)
+            stack.append((b, True))
+            stack.extend((c, False) for c in reversed(children[b]))
+
+    def _new_value(self, value, block):
+        self.values.append(value)
+        self.value_block.append(block)
+        self.value_users.append([])
+        self.test_users.append([])
+        return len(self.values) - 1
+
+    def _reverse_postorder(self):
+        seen = {self.entry}
+        post = []
+        stack = [(self.entry, iter(self.succs[self.entry]))]
+        while stack:
+            b, it = stack[-1]
+            for s in it:
+                if s not in seen:
+                    seen.add(s)
+                    stack.append((s, iter(self.succs[s])))
+                    break
+            else:
+                stack.pop()
+                post.append(b)
+        return post[::-1]
+
+    # --- solver ---
+
+    def _env(self, reads):
+        env = {}
+        for name, v in reads.items():
+            value = self.lattice[v]
+            if value is TOP:
+                return None
+            if value is not UNKNOWN:
+                env[name] = value
+        return env
+
+    def _compute(self, v):
+        value = self.values[v]
+        if value[0] == "phi":
+            result = TOP
+            for p, operand in value[2].items():
+                if (p, value[1]) in self.executable:
+                    result = _meet(result, self.lattice[operand])
+            return result
+        _, expr, path, reads = value
+        env = self._env(reads)
+        if env is None:
+            return TOP
+        result = evaluate(expr, env)
+        for i in path:
+            if not (isinstance(result, tuple) and i < len(result)):
+                return UNKNOWN
+            result = result[i]
+        return result
+
+    def _update(self, v):
+        old = self.lattice[v]
+        new = _meet(old, self._compute(v))
+        if new is not old:
+            self.lattice[v] = new
+            self.ssa_work.append(v)
+
+    # the branches the end of block b can take
+    def _branch(self, b):
+        if b == self.entry:
+            return self.succs[b]
+        graph = self.graph
+        last = graph.blocks[b][-1]
+        kind, node, _ = self.nodes[last]
+        if kind != "test":
+            return self.succs[b]
+        env = self._env(self.test_reads[last])
+        if env is None:
+            return []
+        taken = truth(node, env)
+        return sorted({graph.block_of[s] for s in graph.succs[last]
+                       if taken is UNKNOWN or graph.labels.get((last, s), taken) == taken})
+
+    def _solve(self):
+        self.lattice = [TOP] * len(self.values)
+        self.lattice[0] = UNKNOWN
+        self.executable = set()
+        self.visited = set()
+        self.ssa_work = []
+        flow_work = deque((self.entry, s) for s in self.succs[self.entry])
+        self.visited.add(self.entry)
+        while flow_work or self.ssa_work:
+            while flow_work:
+                edge = flow_work.popleft()
+                if edge in self.executable:
+                    continue
+                self.executable.add(edge)
+                b = edge[1]
+                for _, v in self.phis[b]:
+                    self._update(v)
+                if b not in self.visited:
+                    self.visited.add(b)
+                    for v in self.block_values[b]:
+                        self._update(v)
+                    flow_work.extend((b, s) for s in self._branch(b))
+            while self.ssa_work:
+                v = self.ssa_work.pop()
+                for u in self.value_users[v]:
+                    if self.value_block[u] in self.visited:
+                        self._update(u)
+                for b in self.test_users[v]:
+                    if b in self.visited:
+                        flow_work.extend((b, s) for s in self._branch(b))
+
+    # --- results ---
+
+    # a finally body is in the graph twice, so results are gathered per ast
+    # node over all of its copies
+
+    def constant_tests(self):
+        """(test expression, truth value) for the tests known on every visit."""
+        truths = {}
+        for n, reads in self.test_reads.items():
+            kind, node, stmt = self.nodes[n]
+            if self.graph.block_of[n] not in self.visited:
+                continue
+            # while True: is how a loop that breaks out says so
+            if isinstance(stmt, ast.While) and isinstance(node, ast.Constant) and node.value:
+                continue
+            env = self._env(reads)
+            taken = truth(node, env) if env is not None else UNKNOWN
+            truths.setdefault(id(node), (node, set()))[1].add(taken)
+        return [(node, taken.pop()) for node, taken in truths.values()
+                if len(taken) == 1 and UNKNOWN not in taken]
+
+    def unreachable(self):
+        """First flow node of each block cut off by a constant test."""
+        graph = self.graph
+        reached = {id(self.nodes[n][1]) for b in self.visited if b != self.entry
+                   for n in graph.blocks[b]}
+        found = {}
+        for b in range(len(graph.blocks)):
+            if b not in self.visited and any(p in self.visited for p in self.preds[b]):
+                key = id(self.nodes[graph.blocks[b][0]][1])
+                if key not in reached:
+                    found.setdefault(key, graph.blocks[b][0])
+        return list(found.values())
+
+
+def node_line(kind, node):
+    if kind == "case":
+        return node.pattern.lineno
+    return node.lineno
+
+
+# Every scope of tree, module first, with the names its flow can't see all
+# the stores to: at module level every name a function declares global, in
+# a function its own global and nonlocal declarations and those of the
+# functions nested in it (a nested global is rarely a local of the outer
+# function too, and only costs precision). One walk for the whole tree.
+def scopes_with_exclusions(tree):
+    found = [tree]
+    excluded = {id(tree): set()}
+    stack = [(tree, ())]  # node, enclosing definitions
+    while stack:
+        node, chain = stack.pop()
+        if isinstance(node, (ast.Global, ast.Nonlocal)):
+            for scope in chain:
+                excluded[id(scope)].update(node.names)
+            if isinstance(node, ast.Global):
+                excluded[id(tree)].update(node.names)
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                found.append(child)
+                excluded[id(child)] = set()
+                stack.append((child, chain + (child,)))
+            else:
+                stack.append((child, chain))
+    return [(scope, frozenset(excluded[id(scope)])) for scope in found]
+
+
+def analyze(tree):
+    """(line, message) for each constant test and each block it cuts off."""
+    found = []
+    for scope, excluded in scopes_with_exclusions(tree):
+        sc = ScopeConstants(scope.body, excluded)
+        for node, taken in sc.constant_tests():
+            found.append((node.lineno, f"Conditional statement with constant condition detected (always {taken})"))
+        for n in sc.unreachable():
+            kind, node, _ = sc.nodes[n]
+            found.append((node_line(kind, node), "Unreachable code behind a constant condition"))
+    found.sort(key=lambda m: m[0])
+    return found
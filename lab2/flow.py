@@ -0,0 +1,225 @@
+import ast
+
+# Statement-level control flow graph of one scope's body (a function, a
+# class body or the module), shared by the analyses in astanalysis.py and
+# taint.py.
+#
+# There is one flow node per simple statement, plus one for each if/while
+# test, for header, with header, except clause and match case. Nodes are
+# (kind, ast node, extra) with kind one of "stmt", "test", "for", "with",
+# "handler" and "case". For a "test" the ast node is the test expression
+# itself and extra the if/while statement, for a "case" extra is the match
+# subject. Edges out of a test or loop header carry the branch
+# they stand for in labels[(node, successor)]: True into the body, False
+# past it.
+#
+# Return and raise have no successors. exits are the places the body falls
+# off its end (None when the body itself is empty, (node, label) when it is
+# a branch of node), so "can the end be reached without a return" is a
+# reachability question on this graph.
+
+
+# expressions a flow node evaluates
+def node_exprs(kind, node):
+    if kind == "test":
+        return [node]
+    if kind == "for":
+        return [node.iter]
+    if kind == "with":
+        return [item.context_expr for item in node.items]
+    if kind == "handler":
+        return [node.type] if node.type else []
+    if kind == "case":
+        return [node.guard] if node.guard else []
+    return [c for c in ast.iter_child_nodes(node) if isinstance(c, ast.expr)]
+
+
+def pattern_names(pattern):
+    names = []
+    for p in ast.walk(pattern):
+        if isinstance(p, (ast.MatchAs, ast.MatchStar)) and p.name:
+            names.append(p.name)
+        elif isinstance(p, ast.MatchMapping) and p.rest:
+            names.append(p.rest)
+    return names
+
+
+# case _: / case name: without a guard matches anything
+def irrefutable(case):
+    return isinstance(case.pattern, ast.MatchAs) and case.pattern.pattern is None and case.guard is None
+
+
+def _unlabel(p):
+    return p[0] if isinstance(p, tuple) else p
+
+
+class FlowGraph:
+    def __init__(self, body):
+        self.nodes = []
+        self.preds = []
+        self.succs = []
+        self.labels = {}
+        self.entries = set()
+        self.returns = []  # nodes of return statements
+        self.loops = []  # (header, break nodes) of the enclosing loops
+        self.exits = self._build(body, [None])
+        self._make_blocks()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _add(self, kind, node, preds, extra=None):
+        n = len(self.nodes)
+        self.nodes.append((kind, node, extra))
+        self.preds.append([])
+        self.succs.append([])
+        for p in preds:
+            self._link(p, n)
+        return n
+
+    # p is a node, (node, branch label) or None for the scope's entry
+    def _link(self, p, n):
+        if p is None:
+            self.entries.add(n)
+            return
+        if isinstance(p, tuple):
+            p, label = p
+            self.labels[(p, n)] = label
+        self.preds[n].append(p)
+        self.succs[p].append(n)
+
+    def _build(self, stmts, preds):
+        for stmt in stmts:
+            preds = self._build_stmt(stmt, preds)
+        return preds
+
+    def _build_loop(self, header, stmt):
+        breaks = []
+        self.loops.append((header, breaks))
+        for p in self._build(stmt.body, [(header, True)]):
+            self._link(p, header)
+        self.loops.pop()
+        exits = self._build(stmt.orelse, [(header, False)]) if stmt.orelse else [(header, False)]
+        return exits + breaks
+
+    def _build_stmt(self, stmt, preds):
+        if isinstance(stmt, ast.If):
+            # elif chains nest in orelse, walk them in a loop rather than
+            # recursing once per elif
+            exits = []
+            while True:
+                h = self._add("test", stmt.test, preds, stmt)
+                exits += self._build(stmt.body, [(h, True)])
+                preds = [(h, False)]
+                if len(stmt.orelse) == 1 and isinstance(stmt.orelse[0], ast.If):
+                    stmt = stmt.orelse[0]
+                    continue
+                return exits + (self._build(stmt.orelse, preds) if stmt.orelse else preds)
+        if isinstance(stmt, ast.While):
+            return self._build_loop(self._add("test", stmt.test, preds, stmt), stmt)
+        if isinstance(stmt, (ast.For, ast.AsyncFor)):
+            return self._build_loop(self._add("for", stmt, preds), stmt)
+        if isinstance(stmt, (ast.With, ast.AsyncWith)):
+            return self._build(stmt.body, [self._add("with", stmt, preds)])
+        if isinstance(stmt, (ast.Try, getattr(ast, "TryStar", ast.Try))):
+            start = len(self.nodes)
+            entry = [_unlabel(p) for p in preds if p is not None]
+            exits = self._build(stmt.body, preds)
+            # any statement of the body may be the one that raised
+            raised = entry + list(range(start, len(self.nodes)))
+            if stmt.orelse:
+                exits = self._build(stmt.orelse, exits)
+            for handler in stmt.handlers:
+                exits = exits + self._build(handler.body, [self._add("handler", handler, raised)])
+            if stmt.finalbody:
+                # one copy for falling out of the try normally, one for
+                # leaving it by return or exception, which doesn't fall through
+                leaving = entry + list(range(start, len(self.nodes)))
+                exits = self._build(stmt.finalbody, exits) if exits else []
+                self._build(stmt.finalbody, leaving)
+            return exits
+        if isinstance(stmt, ast.Match):
+            exits = []
+            for case in stmt.cases:
+                c = self._add("case", case, preds, stmt.subject)
+                exits += self._build(case.body, [c])
+            if not (stmt.cases and irrefutable(stmt.cases[-1])):
+                exits += preds  # no case matched
+            return exits
+        n = self._add("stmt", stmt, preds)
+        if isinstance(stmt, ast.Return):
+            self.returns.append(n)
+            return []
+        if isinstance(stmt, ast.Raise):
+            return []
+        if isinstance(stmt, ast.Break) and self.loops:
+            self.loops[-1][1].append(n)
+            return []
+        if isinstance(stmt, ast.Continue) and self.loops:
+            self._link(n, self.loops[-1][0])
+            return []
+        return [n]
+
+    # basic blocks: maximal chains of flow nodes with a single way in; a
+    # branch always ends its block, even when only one side has a node
+    def _make_blocks(self):
+        count = len(self.nodes)
+        leader = [n in self.entries or len(self.preds[n]) != 1
+                  or len(self.succs[self.preds[n][0]]) != 1
+                  or (self.preds[n][0], n) in self.labels for n in range(count)]
+        self.block_of = [None] * count
+        self.blocks = []
+        # a node's single predecessor comes before it, so in index order every
+        # chain is met at its leader; only a loop after a return (a cycle no
+        # edge enters) has no leader, its first node starts the block then
+        for n in range(count):
+            if self.block_of[n] is not None:
+                continue
+            chain = [n]
+            self.block_of[n] = len(self.blocks)
+            while len(self.succs[chain[-1]]) == 1:
+                nxt = self.succs[chain[-1]][0]
+                if leader[nxt] or self.block_of[nxt] is not None:
+                    break
+                chain.append(nxt)
+                self.block_of[nxt] = len(self.blocks)
+            self.blocks.append(chain)
+        self.block_preds = [sorted({self.block_of[p] for p in self.preds[chain[0]]})
+                            for chain in self.blocks]
+        self.block_succs = [sorted({self.block_of[s] for s in self.succs[chain[-1]]})
+                            for chain in self.blocks]
+
+    # --- reachability ---
+
+    # False for the branch a literal test never takes (while True's exit)
+    def feasible(self, p, label):
+        if label is None:
+            return True
+        kind, node, _ = self.nodes[p]
+        if kind == "test" and isinstance(node, ast.Constant):
+            return bool(node.value) == label
+        return True
+
+    def reachable(self):
+        seen = [False] * len(self.nodes)
+        stack = list(self.entries)
+        for n in stack:
+            seen[n] = True
+        while stack:
+            p = stack.pop()
+            for n in self.succs[p]:
+                if not seen[n] and self.feasible(p, self.labels.get((p, n))):
+                    seen[n] = True
+                    stack.append(n)
+        return seen
+
+    def falls_through(self):
+        """True when the end of the body can be reached without a return or raise."""
+        seen = self.reachable()
+        for e in self.exits:
+            if e is None:
+                return True
+            p, label = e if isinstance(e, tuple) else (e, None)
+            if seen[p] and self.feasible(p, label):
+                return True
+        return False
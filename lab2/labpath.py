@@ -0,0 +1,9 @@
+import os
+import sys
+
+# astcache.py and the other modules shared by every lab live at the top of
+# the repo, one level above the lab scripts. Importing this module puts
+# that directory on sys.path, so they can be imported.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,606 @@
+import ast
+import json
+import hashlib
+from collections import namedtuple
+import dataflow
+from flow import FlowGraph, node_exprs, pattern_names
+
+# Flow-sensitive taint analysis for `astanalysis.py taint`.
+#
+# Every scope (the module, each class body and each function) is turned into
+# a statement-level flow graph (flow.py). The dataflow solver (dataflow.py)
+# then propagates the set of tainted names along the graph's basic blocks to
+# a fixpoint, joining with union where paths meet (a name is tainted if it
+# may be tainted on some path). Assignments to a plain name
+# replace its taint, stores into attributes and subscripts only add taint to
+# the object.
+#
+# States are only copied at block boundaries, so long straight-line code
+# stays linear. The taint of an
+# expression is memoized on the expression and the tainted subset of the
+# names it reads, which is all the result depends on, so revisiting a loop
+# re-evaluates only the expressions whose inputs changed.
+#
+# Calls to functions defined in the analyzed module use function summaries
+# (see Program below) instead of assuming every argument reaches the result.
+
+DEFAULT_SOURCES = ("input",)
+DEFAULT_SINKS = ("os.system",)
+DEFAULT_SANITIZERS = ("sanitized",)
+
+# worklist order for the fixpoint, see dataflow.SCHEDULERS
+SCHEDULER = "fifo"
+
+
+class TaintConfig:
+    """Dotted call names that produce taint, consume it, or clean it."""
+
+    def __init__(self, sources=(), sinks=(), sanitizers=()):
+        self.sources = set(DEFAULT_SOURCES) | set(sources)
+        self.sinks = set(DEFAULT_SINKS) | set(sinks)
+        self.sanitizers = set(DEFAULT_SANITIZERS) | set(sanitizers)
+
+    # {"sources": [...], "sinks": [...], "sanitizers": [...]}, every key
+    # optional, added to the defaults
+    @classmethod
+    def load(cls, fname):
+        with open(fname, "r") as f:
+            spec = json.load(f)
+        unknown = set(spec) - {"sources", "sinks", "sanitizers"}
+        if unknown:
+            raise ValueError(f"{fname}: unknown keys {sorted(unknown)}")
+        return cls(spec.get("sources", ()), spec.get("sinks", ()), spec.get("sanitizers", ()))
+
+    def key(self):
+        return (frozenset(self.sources), frozenset(self.sinks), frozenset(self.sanitizers))
+
+
+# import aliases of the whole module, local name -> dotted name
+def import_aliases(tree):
+    aliases = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for a in node.names:
+                if a.asname:
+                    aliases[a.asname] = a.name
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            for a in node.names:
+                aliases[a.asname or a.name] = f"{node.module}.{a.name}"
+    return aliases
+
+
+# "os.system" for os.system(...), None when the callee isn't a plain name
+def call_name(func, aliases):
+    parts = []
+    while isinstance(func, ast.Attribute):
+        parts.append(func.attr)
+        func = func.value
+    if not isinstance(func, ast.Name):
+        return None
+    parts.append(aliases.get(func.id, func.id))
+    return ".".join(reversed(parts))
+
+
+def call_args(call):
+    return list(call.args) + [kw.value for kw in call.keywords]
+
+
+# sub-expressions an expression's taint is made of
+def operands(node):
+    kids = []
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, ast.expr):
+            kids.append(child)
+        elif isinstance(child, ast.keyword):
+            kids.append(child.value)
+        elif isinstance(child, ast.comprehension):
+            kids.append(child.iter)
+            kids.extend(child.ifs)
+    return kids
+
+
+class ScopeTaint(dataflow.Problem):
+    """Taint facts of one scope's body, solved to a fixpoint.
+
+    As a dataflow problem the value of a block is the frozenset of names
+    tainted there, None while no path to it has been found.
+    """
+
+    def __init__(self, body, config, aliases, initial=frozenset(), program=None, use_sources=True):
+        self.config = config
+        self.aliases = aliases
+        self.initial = frozenset(initial)
+        self.program = program
+        # without sources only the initial taint is followed (summaries)
+        self.sources = config.sources if use_sources else frozenset()
+        self.graph = FlowGraph(body)
+        self.nodes = self.graph.nodes
+        self.memo = {}  # (id(expr), tainted names it reads) -> taint
+        self.reads = {}  # id(expr) -> names it reads
+        self.calls = {}  # id(call) -> dotted name
+        self.targets = {}  # id(call) -> [(function, self shift)] it may call
+        self._solve()
+
+    # --- taint of expressions ---
+
+    def name_of(self, call):
+        key = id(call)
+        if key not in self.calls:
+            self.calls[key] = call_name(call.func, self.aliases)
+        return self.calls[key]
+
+    # functions of the module the call may reach, [] for anything else
+    def targets_of(self, call):
+        key = id(call)
+        if key not in self.targets:
+            name = self.name_of(call)
+            config = self.config
+            if self.program is None or name in config.sources or name in config.sinks \
+                    or name in config.sanitizers:
+                self.targets[key] = []
+            else:
+                self.targets[key] = self.program.resolve(call)
+        return self.targets[key]
+
+    # arguments of call that end up in a parameter listed in the summaries
+    def summary_args(self, call, field):
+        args = []
+        for fn, shift in self.targets_of(call):
+            flows = getattr(self.program.summary(fn), field)
+            args += [expr for expr, params in bind_args(fn, call, shift) if params & flows]
+        return args
+
+    def call_operands(self, call):
+        name = self.name_of(call)
+        if name in self.sources or name in self.config.sanitizers:
+            return []
+        if self.targets_of(call):
+            return self.summary_args(call, "to_return")
+        kids = call_args(call)
+        if isinstance(call.func, ast.Attribute):
+            # a method call carries its object's taint
+            kids.append(call.func.value)
+        return kids
+
+    def call_taint(self, call, values):
+        name = self.name_of(call)
+        if name in self.config.sanitizers:
+            return False
+        if name in self.sources:
+            return True
+        if self.sources and any(self.program.summary(fn).returns_taint
+                                for fn, _ in self.targets_of(call)):
+            return True
+        return any(values)
+
+    def tainted(self, expr, state):
+        # the result only depends on which of the names read are tainted
+        reads = self.reads.get(id(expr))
+        if reads is None:
+            reads = frozenset(n.id for n in ast.walk(expr) if isinstance(n, ast.Name))
+            self.reads[id(expr)] = reads
+        key = (id(expr), reads & state)
+        if key in self.memo:
+            return self.memo[key]
+
+        # iterative postorder, deep expressions don't hit the recursion limit
+        values = {}
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            if isinstance(node, ast.Call):
+                kids = self.call_operands(node)
+            elif isinstance(node, (ast.Name, ast.Constant, ast.Lambda)):
+                kids = []
+            else:
+                kids = operands(node)
+            if not ready and kids:
+                stack.append((node, True))
+                stack.extend((c, False) for c in kids)
+                continue
+            if isinstance(node, ast.Name):
+                values[id(node)] = node.id in state
+            elif isinstance(node, ast.Call):
+                values[id(node)] = self.call_taint(node, [values[id(c)] for c in kids])
+            else:
+                values[id(node)] = any(values[id(c)] for c in kids)
+        self.memo[key] = values[id(expr)]
+        return self.memo[key]
+
+    # --- transfer ---
+
+    def _bind(self, target, taint, state):
+        if isinstance(target, ast.Name):
+            if taint:
+                state.add(target.id)
+            else:
+                state.discard(target.id)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for elt in target.elts:
+                self._bind(elt, taint, state)
+        elif isinstance(target, ast.Starred):
+            self._bind(target.value, taint, state)
+        elif isinstance(target, (ast.Attribute, ast.Subscript)) and taint:
+            # a store into part of an object taints the whole object
+            base = target.value
+            while isinstance(base, (ast.Attribute, ast.Subscript)):
+                base = base.value
+            if isinstance(base, ast.Name):
+                state.add(base.id)
+
+    # stores the flow node makes, every right-hand side evaluated before
+    # any of them happens
+    def _stores(self, n, state):
+        kind, node, subject = self.nodes[n]
+        stores = []
+        if kind == "for":
+            stores.append((node.target, self.tainted(node.iter, state)))
+        elif kind == "with":
+            for item in node.items:
+                if item.optional_vars is not None:
+                    stores.append((item.optional_vars, self.tainted(item.context_expr, state)))
+        elif kind == "handler":
+            if node.name:
+                stores.append((ast.Name(node.name), False))
+        elif kind == "case":
+            taint = self.tainted(subject, state)
+            stores += [(ast.Name(name), taint) for name in pattern_names(node.pattern)]
+        elif isinstance(node, ast.Assign):
+            taint = self.tainted(node.value, state)
+            stores += [(target, taint) for target in node.targets]
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            stores.append((node.target, self.tainted(node.value, state)))
+        elif isinstance(node, ast.AugAssign):
+            taint = self.tainted(node.value, state)
+            if isinstance(node.target, ast.Name):
+                taint = taint or node.target.id in state
+            stores.append((node.target, taint))
+        elif isinstance(node, ast.Delete):
+            stores += [(target, False) for target in node.targets if isinstance(target, ast.Name)]
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            stores.append((ast.Name(node.name), False))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            stores += [(ast.Name((a.asname or a.name).split(".")[0]), False) for a in node.names]
+        # assignment expressions anywhere in the evaluated expressions
+        for expr in node_exprs(kind, node):
+            for sub in ast.walk(expr):
+                if isinstance(sub, ast.NamedExpr):
+                    stores.append((sub.target, self.tainted(sub.value, state)))
+        return stores
+
+    # runs a block over a mutable state, visit(n, state) sees the state
+    # before each flow node
+    def run_block(self, block, state, visit=None):
+        for n in self.graph.blocks[block]:
+            if visit is not None:
+                visit(n, state)
+            for target, taint in self._stores(n, state):
+                self._bind(target, taint, state)
+        return state
+
+    # --- fixpoint ---
+
+    def boundary(self, block):
+        return self.initial
+
+    def join(self, a, b):
+        if a is None:
+            return b
+        return a if b is None else a | b
+
+    def transfer(self, block, state):
+        if state is None:
+            return None  # not reached yet (or never, after a return)
+        return frozenset(self.run_block(block, set(state)))
+
+    def _solve(self):
+        graph = self.graph
+        entries = sorted({graph.block_of[n] for n in graph.entries})
+        solution = dataflow.solve(dataflow.Graph(len(graph.blocks), graph.block_preds, graph.block_succs, entries),
+                                  self, SCHEDULER, "taint")
+        self.in_states, self.outs = solution.ins, solution.outs
+        self.stats = solution.stats
+
+    # --- results ---
+
+    def exit_state(self):
+        graph = self.graph
+        state = frozenset()
+        for n in graph.exits:
+            if n is None:
+                state |= self.initial
+                continue
+            if isinstance(n, tuple):
+                n = n[0]  # the branch of a test, which stores nothing
+            b = graph.block_of[n]
+            if self.in_states[b] is not None:
+                state |= self.outs[b] if graph.blocks[b][-1] == n else self._state_after(n)
+        return state
+
+    def _state_after(self, n):
+        b = self.graph.block_of[n]
+        state = set(self.in_states[b])
+        for m in self.graph.blocks[b]:
+            for target, taint in self._stores(m, state):
+                self._bind(target, taint, state)
+            if m == n:
+                break
+        return frozenset(state)
+
+    def _visit(self, check):
+        for b, state in enumerate(self.in_states):
+            if state is not None:
+                self.run_block(b, set(state), check)
+
+    def sink_calls(self):
+        """Calls that may pass tainted data to a sink, in flow order.
+
+        That is calls to a sink with a tainted argument, and calls to module
+        functions with a tainted argument for a parameter that reaches one.
+        """
+        found = []
+
+        def check(n, state):
+            kind, node, _ = self.nodes[n]
+            for expr in node_exprs(kind, node):
+                for call in ast.walk(expr):
+                    if not isinstance(call, ast.Call):
+                        continue
+                    if self.name_of(call) in self.config.sinks:
+                        args = call_args(call)
+                    else:
+                        args = self.summary_args(call, "to_sink")
+                    if any(self.tainted(arg, state) for arg in args):
+                        found.append(call)
+
+        self._visit(check)
+        return found
+
+    def return_tainted(self):
+        """True when some return statement may return tainted data."""
+        found = []
+
+        def check(n, state):
+            kind, node, _ = self.nodes[n]
+            if isinstance(node, ast.Return) and node.value is not None:
+                found.append(self.tainted(node.value, state))
+
+        self._visit(check)
+        return any(found)
+
+
+def scopes(tree):
+    """Function and class definitions of tree, outermost first."""
+    return [node for node in ast.walk(tree)
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))]
+
+
+def param_names(scope):
+    if isinstance(scope, ast.ClassDef):
+        return set()
+    return set(positional_params(scope.args)) | set(other_params(scope.args))
+
+
+def positional_params(args):
+    return [a.arg for a in args.posonlyargs + args.args]
+
+
+def other_params(args):
+    names = [a.arg for a in args.kwonlyargs]
+    return names + [a.arg for a in (args.vararg, args.kwarg) if a is not None]
+
+
+def bind_args(fn, call, shift):
+    """[(argument expression, parameters of fn it may be bound to)]
+
+    shift is 1 when fn is called as a method and its first parameter is the
+    object the method was looked up on.
+    """
+    args = fn.args
+    positional = positional_params(args)
+    everything = frozenset(positional + other_params(args))
+    bound = []
+    if shift and positional:
+        bound.append((call.func.value, frozenset(positional[:1])))
+    positional = positional[shift:]
+    starred = False
+    for i, arg in enumerate(call.args):
+        if isinstance(arg, ast.Starred):
+            starred = True
+            bound.append((arg.value, everything))
+        elif starred:
+            # *args before it, no telling which parameter this is
+            bound.append((arg, everything))
+        elif i < len(positional):
+            bound.append((arg, frozenset((positional[i],))))
+        elif args.vararg is not None:
+            bound.append((arg, frozenset((args.vararg.arg,))))
+    keywords = set(positional) | {a.arg for a in args.kwonlyargs}
+    for kw in call.keywords:
+        if kw.arg is None:
+            bound.append((kw.value, everything))
+        elif kw.arg in keywords:
+            bound.append((kw.value, frozenset((kw.arg,))))
+        elif args.kwarg is not None:
+            bound.append((kw.value, frozenset((args.kwarg.arg,))))
+    return bound
+
+
+# --- Interprocedural summaries ---
+#
+# For each function of the module: whether it may return taint from a source
+# by itself, which parameters may flow to its return value and which may
+# reach a sink (directly or through the functions it calls). A parameter's
+# flows are found by solving the function with only that parameter tainted
+# and sources switched off.
+#
+# Summaries are computed callees first, over the strongly connected
+# components of the call graph; the functions of a component (recursion) are
+# re-solved until none of their summaries grows. A summary only depends on
+# the function's code, its callees (their parameter lists, which arguments
+# are bound by, and their summaries), the configuration and the
+# module-level taint it starts from, so it is cached on those.
+
+Summary = namedtuple("Summary", "returns_taint to_return to_sink")
+NO_FLOWS = Summary(False, frozenset(), frozenset())
+
+_summary_cache = {}
+
+
+# nodes of fn's own body, without the bodies of functions defined in it
+def own_nodes(fn):
+    stack = list(fn.body)
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        stack.extend(ast.iter_child_nodes(node))
+
+
+def is_staticmethod(fn):
+    return any(isinstance(d, ast.Name) and d.id == "staticmethod" for d in fn.decorator_list)
+
+
+class Program:
+    def __init__(self, tree):
+        self.functions = {}  # name -> plain functions (nested ones too)
+        self.methods = {}  # name -> methods of the module's classes
+        methods = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ClassDef):
+                for stmt in node.body:
+                    if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        self.methods.setdefault(stmt.name, []).append(stmt)
+                        methods.add(id(stmt))
+        self.all_functions = []
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                self.all_functions.append(node)
+                if id(node) not in methods:
+                    self.functions.setdefault(node.name, []).append(node)
+        self.summaries = {}  # id(function) -> Summary
+        self.computed = 0  # summaries solved rather than found in the cache
+
+    def resolve(self, call):
+        """[(function, self shift)] a call may reach, by name."""
+        func = call.func
+        if isinstance(func, ast.Name):
+            return [(fn, 0) for fn in self.functions.get(func.id, ())]
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) \
+                and func.value.id in ("self", "cls"):
+            return [(fn, 0 if is_staticmethod(fn) else 1) for fn in self.methods.get(func.attr, ())]
+        return []
+
+    def summary(self, fn):
+        return self.summaries.get(id(fn), NO_FLOWS)
+
+    # what a caller's summary depends on of a callee: which function it is
+    # (bind_args maps arguments by its parameter list) and its own summary
+    def callee_key(self, fn):
+        is_method = any(m is fn for m in self.methods.get(fn.name, ()))
+        return (fn.name, is_method, is_staticmethod(fn), ast.dump(fn.args), self.summary(fn))
+
+    def callees(self, fn):
+        found = {}
+        for node in own_nodes(fn):
+            if isinstance(node, ast.Call):
+                for callee, _ in self.resolve(node):
+                    found[id(callee)] = callee
+        return list(found.values())
+
+    # Tarjan's algorithm without recursion; components come out callees first
+    def components(self):
+        graph = {id(fn): self.callees(fn) for fn in self.all_functions}
+        index = {}
+        low = {}
+        on_stack = set()
+        stack = []
+        comps = []
+        for root in self.all_functions:
+            if id(root) in index:
+                continue
+            work = [(root, iter(graph[id(root)]))]
+            index[id(root)] = low[id(root)] = len(index)
+            stack.append(root)
+            on_stack.add(id(root))
+            while work:
+                fn, kids = work[-1]
+                child = next(kids, None)
+                if child is not None:
+                    if id(child) not in index:
+                        index[id(child)] = low[id(child)] = len(index)
+                        stack.append(child)
+                        on_stack.add(id(child))
+                        work.append((child, iter(graph[id(child)])))
+                    elif id(child) in on_stack:
+                        low[id(fn)] = min(low[id(fn)], index[id(child)])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[id(parent)] = min(low[id(parent)], low[id(fn)])
+                if low[id(fn)] == index[id(fn)]:
+                    comp = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(id(member))
+                        comp.append(member)
+                        if member is fn:
+                            break
+                    comps.append(comp)
+        return comps, graph
+
+    def summarize_all(self, config, aliases, global_taint):
+        comps, graph = self.components()
+        context = (config.key(), frozenset(aliases.items()))
+        for comp in comps:
+            recursive = len(comp) > 1 or any(c is comp[0] for c in graph[id(comp[0])])
+            while True:
+                changed = False
+                for fn in comp:
+                    new = self._summarize(fn, graph[id(fn)], config, aliases, global_taint, context)
+                    if new != self.summary(fn):
+                        self.summaries[id(fn)] = new
+                        changed = True
+                if not (changed and recursive):
+                    break
+
+    def _summarize(self, fn, callees, config, aliases, global_taint, context):
+        params = param_names(fn)
+        initial = global_taint - params
+        body = hashlib.sha256(ast.dump(fn).encode()).hexdigest()
+        key = (body, context, initial, tuple(self.callee_key(c) for c in callees))
+        if key in _summary_cache:
+            return _summary_cache[key]
+        self.computed += 1
+        returns_taint = ScopeTaint(fn.body, config, aliases, initial, self).return_tainted()
+        to_return = set()
+        to_sink = set()
+        for p in params:
+            flow = ScopeTaint(fn.body, config, aliases, {p}, self, use_sources=False)
+            if flow.return_tainted():
+                to_return.add(p)
+            if flow.sink_calls():
+                to_sink.add(p)
+        summary = Summary(returns_taint, frozenset(to_return), frozenset(to_sink))
+        _summary_cache[key] = summary
+        return summary
+
+
+def analyze(tree, config=None):
+    """Calls of the module that may pass tainted data to a sink, in source order."""
+    config = config or TaintConfig()
+    aliases = import_aliases(tree)
+    # what the module level may have tainted by the end; functions start
+    # from that (their own parameters aside)
+    global_taint = ScopeTaint(tree.body, config, aliases).exit_state()
+    program = Program(tree)
+    program.summarize_all(config, aliases, global_taint)
+
+    found = ScopeTaint(tree.body, config, aliases, program=program).sink_calls()
+    for scope in scopes(tree):
+        initial = global_taint - param_names(scope)
+        found += ScopeTaint(scope.body, config, aliases, initial, program).sink_calls()
+    unique = {id(call): call for call in found}
+    return sorted(unique.values(), key=lambda c: (c.lineno, c.col_offset))
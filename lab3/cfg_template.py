@@ -1,107 +1,1254 @@
 import ast
-from typing import List, Set, Optional, Dict
+import os
 import sys
+import json
+import time
+import bisect
+import itertools
+import multiprocessing
+from array import array
+from typing import List, Dict, Optional, Iterable, Tuple
+import labpath  # puts the top of the repo, with the shared modules, on sys.path
+import astcache
+import dataflow
 
-# Global counter for BasicBlock IDs
-_basic_block_counter = 0
+# Blocks are plain integers, numbered per graph: Entry is 0, Exit is 1 and
+# the other blocks follow in the order the builder made them, so building
+# the same code twice gives the same ids. Variables are interned the same
+# way, a statement's defs and uses are tuples of variable ids.
+ENTRY = 0
+EXIT = 1
 
-def _next_basic_block_id():
-    global _basic_block_counter
-    _basic_block_counter += 1
-    return f"BB{_basic_block_counter}"
 
 class StatementType:
     ASSIGNMENT = "assignment"
     IF = "if"
     WHILE = "while"
+    FOR = "for"
     PRINT = "print"
     RETURN = "return"
     OTHER = "other"
 
+
 class Statement:
-    def __init__(self, stmt_type: str, def_set: Set[str], use_set: Set[str], ast_node: ast.AST):
+    __slots__ = ("stmt_type", "defs", "uses", "ast_node")
+
+    def __init__(self, stmt_type: str, defs: Tuple[int, ...], uses: Tuple[int, ...], ast_node: ast.AST):
         self.stmt_type: str = stmt_type
-        self.def_set: Set[str] = def_set
-        self.use_set: Set[str] = use_set
+        self.defs: Tuple[int, ...] = defs
+        self.uses: Tuple[int, ...] = uses
         self.ast_node: ast.AST = ast_node
 
-class BasicBlock:
-    def __init__(self):
-        self.id: str = _next_basic_block_id()
-        self.statements: List[Statement] = []
-        self.def_set: Set[str] = set()
-        self.use_set: Set[str] = set()
-        self.predecessors: Set['BasicBlock'] = set()
-        self.successors: Set['BasicBlock'] = set()
-
-    def add_statement(self, stmt: Statement):
-        self.statements.append(stmt)
-        self.def_set.update(stmt.def_set)
-        self.use_set.update(stmt.use_set)
-
-class EntryBlock(BasicBlock):
-    def __init__(self):
-        super().__init__()
-        self.id = "Entry"
-
-class ExitBlock(BasicBlock):
-    def __init__(self):
-        super().__init__()
-        self.id = "Exit"
+    @property
+    def line(self) -> int:
+        node = self.ast_node
+        if isinstance(node, ast.match_case):
+            node = node.pattern
+        elif isinstance(node, ast.arguments):
+            node = (node.posonlyargs + node.args + [node.vararg] + node.kwonlyargs + [node.kwarg])
+            node = next(a for a in node if a is not None)
+        return getattr(node, "lineno", 0)
+
 
 class ControlFlowGraph:
-    def __init__(self):
-        self.blocks: Set[BasicBlock] = set()
-        self.entry: EntryBlock = EntryBlock()
-        self.exit: ExitBlock = ExitBlock()
-        self.blocks.add(self.entry)
-        self.blocks.add(self.exit)
+    """Blocks, statements and edges in flat arrays.
+
+    The statements of block b are statements[stmt_start[b]:stmt_start[b + 1]],
+    its successors succ[succ_start[b]:succ_start[b + 1]] and its predecessors
+    pred[pred_start[b]:pred_start[b + 1]] (CSR, sorted by id).
+    """
+
+    def __init__(self, name: str = "<module>"):
+        self.name: str = name
+        self.var_names: List[str] = []
+        self.var_ids: Dict[str, int] = {}
+        self.statements: List[Statement] = []
+        self.stmt_start = array("i", [0])
+        self.succ_start = array("i", [0])
+        self.succ = array("i")
+        self.pred_start = array("i", [0])
+        self.pred = array("i")
+        self._masks = None
+        self._graph = None
+
+    def intern(self, name: str) -> int:
+        v = self.var_ids.get(name)
+        if v is None:
+            v = self.var_ids[name] = len(self.var_names)
+            self.var_names.append(name)
+        return v
+
+    def __len__(self) -> int:
+        return len(self.stmt_start) - 1
+
+    def block_name(self, b: int) -> str:
+        if b == ENTRY:
+            return "Entry"
+        if b == EXIT:
+            return "Exit"
+        return f"BB{b - 1}"
+
+    def block_statements(self, b: int) -> List[Statement]:
+        return self.statements[self.stmt_start[b]:self.stmt_start[b + 1]]
+
+    def successors(self, b: int) -> array:
+        return self.succ[self.succ_start[b]:self.succ_start[b + 1]]
+
+    def predecessors(self, b: int) -> array:
+        return self.pred[self.pred_start[b]:self.pred_start[b + 1]]
+
+    def edges(self) -> Iterable[Tuple[int, int]]:
+        for b in range(len(self)):
+            for s in self.successors(b):
+                yield b, s
+
+    def names(self, ids: Iterable[int]) -> List[str]:
+        return [self.var_names[v] for v in ids]
+
+    # the dataflow analyses work on sets of variables as int bitmasks, bit v
+    # for variable id v
+    def mask_names(self, mask: int) -> List[str]:
+        return sorted(self.var_names[v] for v in bits(mask))
+
+    def masks(self) -> Tuple[List[int], List[int]]:
+        """(def mask, use mask) of every statement, in statements order."""
+        if self._masks is None:
+            self._masks = ([bitmask(s.defs) for s in self.statements],
+                           [bitmask(s.uses) for s in self.statements])
+        return self._masks
+
+    def graph(self) -> dataflow.Graph:
+        """The block graph in the form dataflow.solve takes."""
+        if self._graph is None:
+            count = len(self)
+            self._graph = dataflow.Graph(count, [list(self.predecessors(b)) for b in range(count)],
+                                         [list(self.successors(b)) for b in range(count)], [ENTRY], [EXIT])
+        return self._graph
+
+    def reverse_postorder(self, backward: bool = False) -> List[int]:
+        """Blocks in reverse postorder from Entry, or from Exit over the
+        reversed edges; blocks the search can't reach follow in id order."""
+        graph = self.graph()
+        if backward:
+            return dataflow.reverse_postorder(graph.count, graph.preds, graph.exits)
+        return dataflow.reverse_postorder(graph.count, graph.succs, graph.entries)
+
+    # --- export ---
+
+    def to_dict(self) -> dict:
+        blocks = []
+        for b in range(len(self)):
+            blocks.append({
+                "id": b,
+                "name": self.block_name(b),
+                "statements": [{"line": s.line, "type": s.stmt_type, "text": statement_text(s.ast_node),
+                                "defs": list(s.defs), "uses": list(s.uses)}
+                               for s in self.block_statements(b)],
+                "succs": list(self.successors(b)),
+                "preds": list(self.predecessors(b)),
+            })
+        return {"name": self.name, "variables": self.var_names, "blocks": blocks}
+
+    def write_dot(self, out, prefix: str = "") -> None:
+        for b in range(len(self)):
+            lines = [self.block_name(b)] + [f"{s.line}: {statement_text(s.ast_node)}"
+                                            for s in self.block_statements(b)]
+            label = "\\l".join(dot_escape(line) for line in lines) + "\\l"
+            out.write(f'  {prefix}b{b} [label="{label}"];\n')
+        for b, s in self.edges():
+            out.write(f"  {prefix}b{b} -> {prefix}b{s};\n")
+
+
+def bitmask(ids: Iterable[int]) -> int:
+    mask = 0
+    for v in ids:
+        mask |= 1 << v
+    return mask
+
+
+def bits(mask: int) -> List[int]:
+    """Indexes of the set bits of mask, lowest first."""
+    found = []
+    while mask:
+        low = mask & -mask
+        found.append(low.bit_length() - 1)
+        mask ^= low
+    return found
+
+
+def dot_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+
+# first line of a statement, the header only for compound statements
+def statement_text(node: ast.AST) -> str:
+    if isinstance(node, ast.arguments):
+        return f"parameters {ast.unparse(node)}"
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return f"def {node.name}({ast.unparse(node.args)})"
+    if isinstance(node, ast.ClassDef):
+        return f"class {node.name}"
+    if isinstance(node, ast.ExceptHandler):
+        return "except" + (f" {ast.unparse(node.type)}" if node.type else "") + (f" as {node.name}" if node.name else "")
+    if isinstance(node, ast.match_case):
+        return f"case {ast.unparse(node.pattern)}" + (f" if {ast.unparse(node.guard)}" if node.guard else "")
+    if isinstance(node, ast.If):
+        return f"if {ast.unparse(node.test)}"
+    if isinstance(node, ast.While):
+        return f"while {ast.unparse(node.test)}"
+    if isinstance(node, (ast.For, ast.AsyncFor)):
+        return f"for {ast.unparse(node.target)} in {ast.unparse(node.iter)}"
+    if isinstance(node, (ast.With, ast.AsyncWith)):
+        return "with " + ", ".join(ast.unparse(item) for item in node.items)
+    if isinstance(node, ast.Match):
+        return f"match {ast.unparse(node.subject)}"
+    if isinstance(node, ast.expr):
+        return ast.unparse(node)
+    return ast.unparse(node).split("\n")[0]
+
+
+# --- def/use sets ---
+
+# Names the expressions under nodes store (defs) and load (uses), in
+# evaluation order. Lambdas and comprehensions are scopes of their own:
+# their parameters and loop targets are neither, but the outer names they
+# read are uses, and a := inside a comprehension still binds in this scope.
+# A load after a := of the same name reads that value, so it isn't a use.
+# loads, when given, collects (Name node, local) for every load, local when
+# it reads a := of the same statement.
+def names_of(nodes: Iterable[ast.AST], loads: Optional[list] = None) -> Tuple[List[str], List[str]]:
+    defs: Dict[str, None] = {}
+    uses: Dict[str, None] = {}
+    walrus = set()
+    stack = [(node, frozenset()) for node in reversed(list(nodes)) if node is not None]
+    while stack:
+        node, bound = stack.pop()
+        if isinstance(node, ast.Name):
+            if bound is None:  # the target of a := whose value is done
+                defs[node.id] = None
+                walrus.add(node.id)
+            elif node.id in bound:
+                pass
+            elif not isinstance(node.ctx, ast.Load):
+                defs[node.id] = None
+            elif node.id in walrus:
+                if loads is not None:
+                    loads.append((node, True))
+            else:
+                uses[node.id] = None
+                if loads is not None:
+                    loads.append((node, False))
+            continue
+        if isinstance(node, ast.Lambda):
+            args = node.args
+            params = [a.arg for a in args.posonlyargs + args.args + args.kwonlyargs]
+            params += [a.arg for a in (args.vararg, args.kwarg) if a is not None]
+            kids = [(d, bound) for d in args.defaults + [d for d in args.kw_defaults if d is not None]]
+            kids.append((node.body, bound | frozenset(params)))
+        elif isinstance(node, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+            targets = frozenset(n.id for g in node.generators for n in ast.walk(g.target)
+                                if isinstance(n, ast.Name))
+            inner = bound | targets
+            # the first iterable is evaluated outside the comprehension
+            kids = [(node.generators[0].iter, bound)]
+            for i, g in enumerate(node.generators):
+                if i:
+                    kids.append((g.iter, inner))
+                kids += [(cond, inner) for cond in g.ifs]
+            elts = [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+            kids += [(e, inner) for e in elts]
+        elif isinstance(node, ast.NamedExpr):
+            kids = [(node.value, bound), (node.target, None)]
+        else:
+            kids = [(c, bound) for c in ast.iter_child_nodes(node)]
+        stack.extend(reversed(kids))
+    return list(defs), list(uses)
+
+
+def pattern_defs(pattern: ast.AST) -> List[str]:
+    names = []
+    for p in ast.walk(pattern):
+        if isinstance(p, (ast.MatchAs, ast.MatchStar)) and p.name:
+            names.append(p.name)
+        elif isinstance(p, ast.MatchMapping) and p.rest:
+            names.append(p.rest)
+    return names
+
+
+def is_print(stmt: ast.stmt) -> bool:
+    return (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call)
+            and isinstance(stmt.value.func, ast.Name) and stmt.value.func.id == "print")
 
-    def add_block(self, block: BasicBlock):
-        self.blocks.add(block)
 
-    def add_edge(self, from_block: BasicBlock, to_block: BasicBlock):
-        from_block.successors.add(to_block)
-        to_block.predecessors.add(from_block)
+def param_names(args: ast.arguments) -> List[str]:
+    params = [a.arg for a in args.posonlyargs + args.args + args.kwonlyargs]
+    return params + [a.arg for a in (args.vararg, args.kwarg) if a is not None]
+
+
+# (type, defs, uses) of a CFG statement: a simple statement, the header of a
+# compound one (if, while, for, with, match, except clause, match case), or
+# a function's parameters. Its loads go to loads, as in names_of.
+def def_use(node: ast.AST, loads: Optional[list] = None) -> Tuple[str, List[str], List[str]]:
+    if isinstance(node, ast.arguments):
+        return StatementType.OTHER, param_names(node), []
+    if isinstance(node, (ast.If, ast.While)):
+        defs, uses = names_of([node.test], loads)
+        return (StatementType.IF if isinstance(node, ast.If) else StatementType.WHILE), defs, uses
+    if isinstance(node, (ast.For, ast.AsyncFor)):
+        _, uses = names_of([node.iter], loads)
+        defs, _ = names_of([node.target])
+        return StatementType.FOR, defs, uses
+    if isinstance(node, (ast.With, ast.AsyncWith)):
+        parts = []
+        for item in node.items:
+            parts += [item.context_expr, item.optional_vars]
+        defs, uses = names_of(parts, loads)
+        return StatementType.OTHER, defs, uses
+    if isinstance(node, ast.Match):
+        _, uses = names_of([node.subject], loads)
+        return StatementType.OTHER, [], uses
+    if isinstance(node, ast.ExceptHandler):
+        _, uses = names_of([node.type], loads)
+        return StatementType.OTHER, [node.name] if node.name else [], uses
+    if isinstance(node, ast.match_case):
+        # the guard runs after the pattern bound its names
+        captured = pattern_defs(node.pattern)
+        _, uses = names_of([node.pattern], loads)
+        guard_loads = [] if loads is not None else None
+        _, guard_uses = names_of([node.guard], guard_loads)
+        uses += [u for u in guard_uses if u not in captured and u not in uses]
+        if loads is not None:
+            loads += [(n, local or n.id in captured) for n, local in guard_loads]
+        return StatementType.OTHER, captured, uses
+    return simple_def_use(node, loads)
+
+
+def simple_def_use(stmt: ast.stmt, loads: Optional[list] = None) -> Tuple[str, List[str], List[str]]:
+    if isinstance(stmt, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+        if isinstance(stmt, ast.AnnAssign) and stmt.value is None:
+            return StatementType.OTHER, [], []
+        targets = stmt.targets if isinstance(stmt, ast.Assign) else [stmt.target]
+        defs, uses = names_of([stmt.value] + targets, loads)
+        if isinstance(stmt, ast.AugAssign) and isinstance(stmt.target, ast.Name):
+            # x += 1 reads x through its target
+            if stmt.target.id not in uses:
+                uses.insert(0, stmt.target.id)
+            if loads is not None:
+                loads.insert(0, (stmt.target, False))
+        return StatementType.ASSIGNMENT, defs, uses
+    if isinstance(stmt, ast.Return):
+        defs, uses = names_of([stmt.value], loads)
+        return StatementType.RETURN, defs, uses
+    if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        if isinstance(stmt, ast.ClassDef):
+            evaluated = stmt.bases + [kw.value for kw in stmt.keywords]
+        else:
+            evaluated = stmt.args.defaults + [d for d in stmt.args.kw_defaults if d is not None]
+        _, uses = names_of(stmt.decorator_list + evaluated, loads)
+        return StatementType.OTHER, [stmt.name], uses
+    if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+        return StatementType.OTHER, [(a.asname or a.name).split(".")[0] for a in stmt.names if a.name != "*"], []
+    if isinstance(stmt, (ast.Global, ast.Nonlocal)):
+        return StatementType.OTHER, [], []
+    defs, uses = names_of(ast.iter_child_nodes(stmt), loads)
+    return (StatementType.PRINT if is_print(stmt) else StatementType.OTHER), defs, uses
+
+
+# --- construction ---
+
+class _Builder:
+    """Builds the blocks of one body, see make_cfg."""
+
+    def __init__(self, cfg: ControlFlowGraph):
+        self.cfg = cfg
+        self.blocks: List[List[Statement]] = [[], []]  # Entry, Exit
+        self.succs: List[List[int]] = [[], []]
+        self.loops: List[Tuple[int, List[int]]] = []  # (header, blocks ending in break)
+        self.handlers: List[List[int]] = []  # blocks of the enclosing try bodies
+
+    def new_block(self) -> int:
+        self.blocks.append([])
+        self.succs.append([])
+        if self.handlers:
+            self.handlers[-1].append(len(self.blocks) - 1)
+        return len(self.blocks) - 1
+
+    def edge(self, a: Optional[int], b: int) -> None:
+        if a is not None and b not in self.succs[a]:
+            self.succs[a].append(b)
+
+    def add(self, block: Optional[int], node: ast.AST) -> int:
+        if block is None:
+            block = self.new_block()  # code no path reaches
+        stmt_type, defs, uses = def_use(node)
+        cfg = self.cfg
+        self.blocks[block].append(Statement(stmt_type, tuple(cfg.intern(n) for n in defs),
+                                            tuple(cfg.intern(n) for n in uses), node))
+        return block
+
+    def body(self, stmts: List[ast.stmt], block: Optional[int]) -> Optional[int]:
+        """Adds stmts after block, returns the block flow continues in (None if it can't)."""
+        for stmt in stmts:
+            # in a try body every statement starts a block of its own, so the
+            # handlers see the state between any two statements
+            if self.handlers and block is not None and self.blocks[block]:
+                block = self.branch(block)
+            block = self.stmt(stmt, block)
+        return block
+
+    def branch(self, block: int) -> int:
+        b = self.new_block()
+        self.edge(block, b)
+        return b
+
+    def stmt(self, stmt: ast.stmt, block: Optional[int]) -> Optional[int]:
+        if isinstance(stmt, ast.If):
+            # elif chains nest in orelse, walk them in a loop
+            ends = []
+            while True:
+                block = self.add(block, stmt)
+                ends.append(self.body(stmt.body, self.branch(block)))
+                if len(stmt.orelse) == 1 and isinstance(stmt.orelse[0], ast.If):
+                    block = self.branch(block)
+                    stmt = stmt.orelse[0]
+                    continue
+                ends.append(self.body(stmt.orelse, self.branch(block)) if stmt.orelse else block)
+                return self.join(ends)
+        if isinstance(stmt, (ast.While, ast.For, ast.AsyncFor)):
+            header = self.new_block()
+            self.edge(block, header)
+            self.add(header, stmt)
+            breaks = []
+            self.loops.append((header, breaks))
+            self.edge(self.body(stmt.body, self.branch(header)), header)
+            self.loops.pop()
+            end = self.body(stmt.orelse, self.branch(header)) if stmt.orelse else header
+            return self.join([end] + breaks)
+        if isinstance(stmt, (ast.With, ast.AsyncWith)):
+            return self.body(stmt.body, self.add(block, stmt))
+        if isinstance(stmt, (ast.Try, getattr(ast, "TryStar", ast.Try))):
+            return self.try_stmt(stmt, block)
+        if isinstance(stmt, ast.Match):
+            block = self.add(block, stmt)
+            ends = []
+            for case in stmt.cases:
+                test = self.add(self.branch(block), case)
+                ends.append(self.body(case.body, self.branch(test)))
+                block = test
+            last = stmt.cases[-1] if stmt.cases else None
+            if not (last and isinstance(last.pattern, ast.MatchAs) and last.pattern.pattern is None and last.guard is None):
+                ends.append(block)  # no case matched
+            return self.join(ends)
+
+        block = self.add(block, stmt)
+        if isinstance(stmt, ast.Return):
+            self.edge(block, EXIT)
+            return None
+        if isinstance(stmt, ast.Raise):
+            # caught by an enclosing try (its handlers hang off every block
+            # of its body), otherwise out of the function
+            if not self.handlers:
+                self.edge(block, EXIT)
+            return None
+        if isinstance(stmt, ast.Break) and self.loops:
+            self.loops[-1][1].append(block)
+            return None
+        if isinstance(stmt, ast.Continue) and self.loops:
+            self.edge(block, self.loops[-1][0])
+            return None
+        return block
+
+    # Every block of the body may raise into each handler, and so may the
+    # point before the first statement, which start is kept empty for. The
+    # body goes one statement per block (see body), so the end of a block
+    # is the state before the next statement. finally is entered from the
+    # normal and the handled paths and, for the exceptions no handler
+    # takes, from every block of the body; flow goes on after it either
+    # way. A return leaving from inside the try goes straight to Exit.
+    def try_stmt(self, stmt: ast.stmt, block: Optional[int]) -> Optional[int]:
+        start = self.branch(block) if block is not None else self.new_block()
+        self.handlers.append([start])
+        end = self.body(stmt.body, self.branch(start))
+        raising = self.handlers.pop()
+        if self.handlers:
+            self.handlers[-1].extend(raising)
+        if stmt.orelse and end is not None:
+            end = self.body(stmt.orelse, self.branch(end))
+        elif stmt.orelse:
+            end = self.body(stmt.orelse, None)
+        ends = [end]
+        for handler in stmt.handlers:
+            h = self.new_block()
+            for b in raising:
+                self.edge(b, h)
+            self.add(h, handler)
+            ends.append(self.body(handler.body, h))
+        if not stmt.finalbody:
+            return self.join(ends)
+        final = self.new_block()
+        for b in [e for e in ends if e is not None] + raising:
+            self.edge(b, final)
+        return self.body(stmt.finalbody, final)
+
+    def join(self, ends: List[Optional[int]]) -> Optional[int]:
+        ends = [e for e in ends if e is not None]
+        if not ends:
+            return None
+        b = self.new_block()
+        for e in ends:
+            self.edge(e, b)
+        return b
+
+    def finish(self, end: Optional[int]) -> None:
+        """Links the end of the body to Exit and fills the graph's arrays."""
+        self.edge(end, EXIT)
+        blocks, succs = self.blocks, self.succs
+
+        # empty blocks the builder used as join points just forward to their
+        # single successor (or nowhere, after a return)
+        forwarded = {}
+
+        def forward(b):
+            start = b
+            while b > EXIT and not blocks[b] and len(succs[b]) == 1:
+                if b in forwarded:
+                    b = forwarded[b]
+                    break
+                b = succs[b][0]
+            forwarded[start] = b
+            return b
+
+        keep = [b for b in range(len(blocks)) if b <= EXIT or blocks[b] or len(succs[b]) > 1]
+        new_id = {b: i for i, b in enumerate(keep)}
+        cfg = self.cfg
+        out_succs = []
+        for b in keep:
+            cfg.statements.extend(blocks[b])
+            cfg.stmt_start.append(len(cfg.statements))
+            out = set()
+            for s in succs[b]:
+                s = forward(s)
+                if s in new_id:
+                    out.add(new_id[s])
+            out_succs.append(sorted(out))
+        preds = [[] for _ in keep]
+        for b, out in enumerate(out_succs):
+            for s in out:
+                preds[s].append(b)
+            cfg.succ.extend(out)
+            cfg.succ_start.append(len(cfg.succ))
+        for p in preds:
+            cfg.pred.extend(p)
+            cfg.pred_start.append(len(cfg.pred))
 
 
 def make_cfg(ast_node: ast.AST) -> ControlFlowGraph:
     """
     Constructs a Control Flow Graph (CFG) from the given AST node (tree or subtree).
     Returns a ControlFlowGraph instance representing the CFG.
+
+    For a function the body is the graph and its parameters are defined in
+    the Entry block; for a module or class its body; any other statement is
+    a body of its own. Nested functions and classes are single statements
+    defining their name.
     """
-    cfg = ControlFlowGraph()
-    # TODO: Traverse the AST and build basic blocks and edges.
-    # This is a template; actual implementation should analyze the AST,
-    # create Statement objects, group them into BasicBlocks, and connect blocks.
+    if isinstance(ast_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        cfg = ControlFlowGraph(ast_node.name)
+    elif isinstance(ast_node, ast.ClassDef):
+        cfg = ControlFlowGraph(ast_node.name)
+    else:
+        cfg = ControlFlowGraph()
+    builder = _Builder(cfg)
+    if isinstance(ast_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        if param_names(ast_node.args):
+            builder.add(ENTRY, ast_node.args)
+        body = ast_node.body
+    elif isinstance(ast_node, (ast.Module, ast.Interactive, ast.ClassDef)):
+        body = ast_node.body
+    else:
+        body = [ast_node]
+    builder.finish(builder.body(body, builder.branch(ENTRY)))
     return cfg
 
 
+# the module and every function and class in it, in source order; they can
+# only sit in statement lists, so expressions aren't walked
+def all_scopes(tree: ast.AST) -> List[ast.AST]:
+    scopes = [tree]
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        for field in ("body", "orelse", "finalbody", "handlers", "cases"):
+            for child in reversed(getattr(node, field, None) or ()):
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    scopes.append(child)
+                stack.append(child)
+    scopes[1:] = sorted(scopes[1:], key=lambda node: (node.lineno, node.col_offset))
+    return scopes
+
+
+def all_cfgs(tree: ast.AST) -> List[ControlFlowGraph]:
+    return [make_cfg(scope) for scope in all_scopes(tree)]
+
+
+# statements of scope's own graph, nested functions and classes counting as one
+def scope_size(scope: ast.AST) -> int:
+    size = 0
+    stack = [scope]
+    while stack:
+        node = stack.pop()
+        for field in ("body", "orelse", "finalbody", "handlers", "cases"):
+            for child in getattr(node, field, None) or ():
+                size += 1
+                if not isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    stack.append(child)
+    return size
+
+
+# names a function's locals may be seen by from outside its own graph: read
+# in a nested function or class, or declared global or nonlocal
+def shared_names(scope: ast.AST) -> set:
+    names = set()
+    stack = [scope]
+    while stack:
+        node = stack.pop()
+        for field in ("body", "orelse", "finalbody", "handlers", "cases"):
+            for child in getattr(node, field, None) or ():
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    names.update(n.id for n in ast.walk(child) if isinstance(n, ast.Name))
+                elif isinstance(child, (ast.Global, ast.Nonlocal)):
+                    names.update(child.names)
+                else:
+                    stack.append(child)
+    return names
+
+
 def main():
+    # --schedule <fifo|rpo|loop> picks the dataflow worklist order
+    scheduler = "rpo"
+    if len(sys.argv) >= 4 and sys.argv[1] in ("liveness", "reaching", "pipeline") and sys.argv[2] == "--schedule":
+        if sys.argv[3] not in dataflow.SCHEDULERS:
+            print(f"Unknown schedule {sys.argv[3]}, one of {', '.join(dataflow.SCHEDULERS)}")
+            return -1
+        scheduler = sys.argv[3]
+        del sys.argv[2:4]
     if len(sys.argv) == 3 and sys.argv[1] == "CFG":
         return do_CFG(sys.argv[2])
+    elif len(sys.argv) == 5 and sys.argv[1] == "CFG" and sys.argv[2] in ("--dot", "--json"):
+        return do_CFG(sys.argv[4], sys.argv[2][2:], sys.argv[3])
     elif len(sys.argv) == 3 and sys.argv[1] == "liveness":
-        return do_liveness(sys.argv[2])
+        return do_liveness(sys.argv[2], scheduler)
     elif len(sys.argv) == 3 and sys.argv[1] == "reaching":
-        return do_reaching(sys.argv[2])
+        return do_reaching(sys.argv[2], None, scheduler)
+    elif len(sys.argv) == 5 and sys.argv[1] == "reaching" and sys.argv[2] == "--json":
+        return do_reaching(sys.argv[4], sys.argv[3], scheduler)
+    elif len(sys.argv) == 3 and sys.argv[1] == "solvers":
+        return do_solvers(sys.argv[2])
+    elif len(sys.argv) == 3 and sys.argv[1] == "pipeline":
+        return do_pipeline(sys.argv[2], None, scheduler)
+    elif len(sys.argv) == 5 and sys.argv[1] == "pipeline" and sys.argv[2] == "--json":
+        return do_pipeline(sys.argv[4], sys.argv[3], scheduler)
+    elif len(sys.argv) == 3 and sys.argv[1] == "ssa":
+        return do_ssa(sys.argv[2])
+    elif len(sys.argv) == 4 and sys.argv[1] == "ssa" and sys.argv[2] == "--minimal":
+        return do_ssa(sys.argv[3], pruned=False)
     else:
         print("Usage: python cfg.py <cmd> <file>")
+        print("       python cfg.py CFG --dot|--json <outfile> <file>")
+        print("       python cfg.py liveness|reaching --schedule fifo|rpo|loop <file>")
+        print("       python cfg.py reaching --json <outfile> <file>")
+        print("       python cfg.py ssa [--minimal] <file>")
+        print("       python cfg.py pipeline [--schedule fifo|rpo|loop] [--json <outfile>] <file | dir | glob>")
         return -1
-    
+
+
+# --- liveness ---
+
+class Liveness(dataflow.Problem):
+    """Live variables at the start and end of every block, as bitmasks.
+
+    Only variables the graph defines somewhere are tracked; a global or
+    builtin is never killed, so it would just be live everywhere before its
+    first use. scheduler picks the dataflow worklist order (see dataflow.py),
+    stats is what solving took.
+    """
+
+    backward = True
+    bottom = 0
+
+    def __init__(self, cfg: ControlFlowGraph, scheduler: str = "rpo"):
+        self.cfg = cfg
+        def_masks, use_masks = cfg.masks()
+        tracked = 0
+        for m in def_masks:
+            tracked |= m
+        self.tracked = tracked
+        count = len(cfg)
+        self.gen = [0] * count  # used before any def in the block
+        self.kill = [0] * count
+        for b in range(count):
+            gen = kill = 0
+            for i in range(cfg.stmt_start[b + 1] - 1, cfg.stmt_start[b] - 1, -1):
+                gen = (gen & ~def_masks[i]) | (use_masks[i] & tracked)
+                kill |= def_masks[i]
+            self.gen[b], self.kill[b] = gen, kill
+        solution = dataflow.solve(cfg.graph(), self, scheduler, "liveness")
+        self.live_in: List[int] = solution.before
+        self.live_out: List[int] = solution.after
+        self.stats = solution.stats
+
+    def join(self, a: int, b: int) -> int:
+        return a | b
+
+    def transfer(self, b: int, live: int) -> int:
+        return self.gen[b] | (live & ~self.kill[b])
+
+    def statement_sets(self, b: int) -> List[Tuple[Statement, int, int]]:
+        """(statement, live before it, live after it) for the statements of b."""
+        cfg = self.cfg
+        def_masks, use_masks = cfg.masks()
+        live = self.live_out[b]
+        result = []
+        for i in range(cfg.stmt_start[b + 1] - 1, cfg.stmt_start[b] - 1, -1):
+            before = (live & ~def_masks[i]) | (use_masks[i] & self.tracked)
+            result.append((cfg.statements[i], before, live))
+            live = before
+        result.reverse()
+        return result
+
+
+# --- reaching definitions ---
+
+class ReachingDefinitions(dataflow.Problem):
+    """Definitions reaching the start and end of every block, as bitmasks.
+
+    A definition is one variable a statement defines, numbered in statement
+    order: defs[d] is (statement index, variable id). Parameters are
+    definitions of the Entry block. scheduler and stats are as in Liveness.
+    """
+
+    bottom = 0
+
+    def __init__(self, cfg: ControlFlowGraph, scheduler: str = "rpo"):
+        self.cfg = cfg
+        self.defs: List[Tuple[int, int]] = []
+        self.stmt_defs: List[int] = []  # statement index -> mask of its definitions
+        self.var_defs: Dict[int, int] = {}  # variable id -> mask of all its definitions
+        for i, stmt in enumerate(cfg.statements):
+            mask = 0
+            for v in stmt.defs:
+                d = len(self.defs)
+                self.defs.append((i, v))
+                mask |= 1 << d
+                self.var_defs[v] = self.var_defs.get(v, 0) | (1 << d)
+            self.stmt_defs.append(mask)
+        count = len(cfg)
+        self.gen = [0] * count
+        self.kill = [0] * count
+        for b in range(count):
+            gen = kill = 0
+            for i in range(cfg.stmt_start[b], cfg.stmt_start[b + 1]):
+                killed = self.stmt_kill(i)
+                gen = (gen & ~killed) | self.stmt_defs[i]
+                kill |= killed
+            self.gen[b], self.kill[b] = gen, kill
+        solution = dataflow.solve(cfg.graph(), self, scheduler, "reaching")
+        self.reach_in: List[int] = solution.before
+        self.reach_out: List[int] = solution.after
+        self.stats = solution.stats
+
+    # every definition of the variables statement i defines
+    def stmt_kill(self, i: int) -> int:
+        killed = 0
+        for v in self.cfg.statements[i].defs:
+            killed |= self.var_defs[v]
+        return killed
+
+    def join(self, a: int, b: int) -> int:
+        return a | b
+
+    def transfer(self, b: int, reach: int) -> int:
+        return self.gen[b] | (reach & ~self.kill[b])
+
+    def statement_sets(self, b: int) -> List[Tuple[Statement, int, int]]:
+        """(statement index, reaching before it, reaching after it) for the statements of b."""
+        reach = self.reach_in[b]
+        result = []
+        for i in range(self.cfg.stmt_start[b], self.cfg.stmt_start[b + 1]):
+            after = (reach & ~self.stmt_kill(i)) | self.stmt_defs[i]
+            result.append((i, reach, after))
+            reach = after
+        return result
+
+    def def_label(self, d: int) -> str:
+        i, v = self.defs[d]
+        return f"{self.cfg.var_names[v]}@{self.cfg.statements[i].line}"
+
+
+class DefUseIndex:
+    """def->uses and use->defs chains of one CFG, from its reaching definitions.
+
+    A use is one Name load, keyed by its (line, column); uses[u] is
+    (variable, line, column, statement index) and defs[d] is (variable,
+    line, statement index). use_defs[(line, col)] lists the definitions
+    that may reach that load, def_uses[d] the uses d may reach. A load
+    after a := (or a match guard reading what its pattern captured) is
+    reached by that statement's own definition. Loads of names the graph
+    never defines (globals, builtins) are uses with no definitions.
+    to_dict/from_dict give a JSON-ready form.
+    """
+
+    def __init__(self, name: str, defs: List[Tuple[str, int, int]], uses: List[Tuple[str, int, int, int]],
+                 chains: List[List[int]]):
+        self.name = name
+        self.defs = defs
+        self.uses = uses
+        self.use_defs: Dict[Tuple[int, int], List[int]] = {}
+        self.def_uses: List[List[int]] = [[] for _ in defs]
+        for u, (use, reaching) in enumerate(zip(uses, chains)):
+            self.use_defs[(use[1], use[2])] = reaching
+            for d in reaching:
+                self.def_uses[d].append(u)
+        self.chains = chains
+
+    @classmethod
+    def build(cls, reaching: ReachingDefinitions) -> "DefUseIndex":
+        cfg = reaching.cfg
+        defs = [(cfg.var_names[v], cfg.statements[i].line, i) for i, v in reaching.defs]
+        uses = []
+        chains = []
+        for b in range(len(cfg)):
+            for i, before, _ in reaching.statement_sets(b):
+                loads = []
+                def_use(cfg.statements[i].ast_node, loads)
+                for node, local in loads:
+                    v = cfg.var_ids[node.id]
+                    uses.append((node.id, node.lineno, node.col_offset, i))
+                    reach = reaching.stmt_defs[i] if local else before
+                    chains.append(bits(reach & reaching.var_defs.get(v, 0)))
+        return cls(cfg.name, defs, uses, chains)
+
+    def reaching(self, node: ast.Name) -> List[Tuple[str, int, int]]:
+        """The definitions that may reach the load node."""
+        return [self.defs[d] for d in self.use_defs.get((node.lineno, node.col_offset), [])]
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "defs": [list(d) for d in self.defs],
+                "uses": [list(u) for u in self.uses], "chains": self.chains}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DefUseIndex":
+        return cls(data["name"], [tuple(d) for d in data["defs"]],
+                   [tuple(u) for u in data["uses"]], data["chains"])
+
+
+# --- dominators and SSA ---
+
+class Dominators:
+    """Dominator tree of a CFG, by Cooper, Harvey and Kennedy (dataflow.py).
+
+    idom[b] is the immediate dominator of b; Entry's is Entry, and blocks
+    Entry can't reach have None. children[b] are the blocks b immediately
+    dominates, in reverse postorder, and frontier[b] is b's dominance
+    frontier.
+    """
+
+    def __init__(self, cfg: ControlFlowGraph):
+        self.cfg = cfg
+        graph = cfg.graph()
+        count = len(cfg)
+        self.order = cfg.reverse_postorder()
+        self.idom: List[Optional[int]] = dataflow.dominators(graph.preds, self.order)
+        self.children: List[List[int]] = [[] for _ in range(count)]
+        for b in self.order[1:]:
+            if self.idom[b] is not None:
+                self.children[self.idom[b]].append(b)
+        self.frontier: List[set] = dataflow.dominance_frontiers(graph.preds, self.idom)
+        # preorder number and subtree size of every block in the tree, so b
+        # is under a when its number falls in a's range
+        self.pre = [-1] * count
+        self.size = [1] * count
+        preorder = []
+        stack = [ENTRY]
+        while stack:
+            b = stack.pop()
+            self.pre[b] = len(preorder)
+            preorder.append(b)
+            stack.extend(reversed(self.children[b]))
+        for b in reversed(preorder[1:]):
+            self.size[self.idom[b]] += self.size[b]
+
+    def dominates(self, a: int, b: int) -> bool:
+        """True when every path from Entry to b goes through a (or a is b)."""
+        if self.pre[a] < 0 or self.pre[b] < 0:
+            return False
+        return self.pre[a] <= self.pre[b] < self.pre[a] + self.size[a]
+
+    def iterated_frontier(self, blocks: Iterable[int]) -> List[int]:
+        """Where definitions in blocks meet others: the blocks that need a
+        phi for a variable blocks define, sorted."""
+        result = set()
+        work = list(blocks)
+        queued = set(work)
+        while work:
+            b = work.pop()
+            for d in self.frontier[b]:
+                result.add(d)
+                if d not in queued:
+                    queued.add(d)
+                    work.append(d)
+        return sorted(result)
+
+
+class SSAForm:
+    """Static single assignment form of a CFG, over its variable ids.
+
+    values[x] is (kind, variable id, where): ("entry", v, -1) is the value v
+    has before any definition (a global, a builtin or unbound), and is value
+    v itself; ("def", v, i) is statement i's definition of v and ("phi", v,
+    b) a phi at the start of block b. Phis go in the iterated dominance
+    frontier of the blocks defining v; pruned SSA keeps only those where v
+    is live, minimal SSA all of them.
+
+    stmt_uses[i] and stmt_defs[i] are the values statement i reads and
+    defines, in the order of its uses and defs, phi_args[x] the value
+    coming in over each predecessor of the phi's block. stmt_users[x] and
+    phi_users[x] are the def-use edges, the statements and phis reading x.
+    Blocks Entry can't reach are renamed on their own, from the entry
+    values. version[x] numbers the values of a variable in renaming order,
+    label(x) shows it as "name.version".
+    """
+
+    def __init__(self, cfg: ControlFlowGraph, pruned: bool = True):
+        self.cfg = cfg
+        self.pruned = pruned
+        dom = self.dominators = Dominators(cfg)
+        count = len(cfg)
+        self.values: List[Tuple[str, int, int]] = [("entry", v, -1) for v in range(len(cfg.var_names))]
+        self.version: List[int] = [0] * len(self.values)
+
+        def_blocks: Dict[int, set] = {}
+        for b in range(count):
+            for stmt in cfg.block_statements(b):
+                for v in stmt.defs:
+                    def_blocks.setdefault(v, set()).add(b)
+        live_in = Liveness(cfg).live_in if pruned else None
+        self.phis: List[List[int]] = [[] for _ in range(count)]
+        self.phi_args: Dict[int, List[int]] = {}
+        for v in sorted(def_blocks):
+            for d in dom.iterated_frontier(def_blocks[v]):
+                if live_in is None or live_in[d] >> v & 1:
+                    x = self._new_value("phi", v, d)
+                    self.phis[d].append(x)
+                    self.phi_args[x] = [v] * len(cfg.predecessors(d))
+
+        self.stmt_uses: List[Tuple[int, ...]] = [()] * len(cfg.statements)
+        self.stmt_defs: List[Tuple[int, ...]] = [()] * len(cfg.statements)
+        self._rename()
+        self.stmt_users: List[List[int]] = [[] for _ in self.values]
+        self.phi_users: List[List[int]] = [[] for _ in self.values]
+        for i, used in enumerate(self.stmt_uses):
+            for x in used:
+                self.stmt_users[x].append(i)
+        for x, args in self.phi_args.items():
+            for a in sorted(set(args)):
+                self.phi_users[a].append(x)
+
+    def _new_value(self, kind: str, v: int, where: int) -> int:
+        self.values.append((kind, v, where))
+        self.version.append(0)
+        return len(self.values) - 1
+
+    def _rename(self):
+        cfg, dom = self.cfg, self.dominators
+        current = [[v] for v in range(len(cfg.var_names))]  # variable -> stack of values
+        versions = [1] * len(cfg.var_names)
+
+        def push(x):
+            v = self.values[x][1]
+            current[v].append(x)
+            self.version[x] = versions[v]
+            versions[v] += 1
+            return v
+
+        roots = [ENTRY] + [b for b in range(len(cfg)) if dom.idom[b] is None]
+        # (block, None) to rename it, (block, variables it pushed) to leave it
+        stack = [(b, None) for b in reversed(roots)]
+        while stack:
+            b, pushed = stack.pop()
+            if pushed is not None:
+                for v in pushed:
+                    current[v].pop()
+                continue
+            pushed = [push(x) for x in self.phis[b]]
+            for i in range(cfg.stmt_start[b], cfg.stmt_start[b + 1]):
+                stmt = cfg.statements[i]
+                # uses are read before the statement's own definitions
+                self.stmt_uses[i] = tuple(current[v][-1] for v in stmt.uses)
+                defs = []
+                for v in stmt.defs:
+                    x = self._new_value("def", v, i)
+                    pushed.append(push(x))
+                    defs.append(x)
+                self.stmt_defs[i] = tuple(defs)
+            for s in cfg.successors(b):
+                if not self.phis[s]:
+                    continue
+                # b's place among s's predecessors, which are sorted
+                k = bisect.bisect_left(cfg.pred, b, cfg.pred_start[s], cfg.pred_start[s + 1]) - cfg.pred_start[s]
+                for x in self.phis[s]:
+                    self.phi_args[x][k] = current[self.values[x][1]][-1]
+            stack.append((b, pushed))
+            stack.extend((c, None) for c in reversed(dom.children[b]))
+
+    def label(self, x: int) -> str:
+        return f"{self.cfg.var_names[self.values[x][1]]}.{self.version[x]}"
+
+    def phi_count(self) -> int:
+        return len(self.phi_args)
+
+
+def format_set(cfg: ControlFlowGraph, mask: int) -> str:
+    return "{" + ", ".join(cfg.mask_names(mask)) + "}"
+
+
+def print_cfg(cfg: ControlFlowGraph) -> None:
+    print(f"CFG of {cfg.name}")
+    for b in range(len(cfg)):
+        print(f"  {cfg.block_name(b)}")
+        for s in cfg.block_statements(b):
+            defs = ", ".join(cfg.names(s.defs)) or "-"
+            uses = ", ".join(cfg.names(s.uses)) or "-"
+            print(f"    {s.line}: {statement_text(s.ast_node)}  [{s.stmt_type}; def {defs}; use {uses}]")
+        succs = ", ".join(cfg.block_name(s) for s in cfg.successors(b))
+        if succs:
+            print(f"    -> {succs}")
+
+
 # Exercise 1
-def do_CFG(fname):
-    print("CFG not implemented")
-    return -1
+def do_CFG(fname, fmt=None, outname=None):
+    cfgs = all_cfgs(astcache.parse_file(fname))
+    if fmt == "json":
+        with open(outname, "w") as out:
+            json.dump({"file": fname, "cfgs": [cfg.to_dict() for cfg in cfgs]}, out, indent=1)
+    elif fmt == "dot":
+        with open(outname, "w") as out:
+            out.write("digraph {\n  node [shape=box];\n")
+            for i, cfg in enumerate(cfgs):
+                out.write(f'  subgraph cluster_{i} {{\n  label="{dot_escape(cfg.name)}";\n')
+                cfg.write_dot(out, f"f{i}_")
+                out.write("  }\n")
+            out.write("}\n")
+    else:
+        for cfg in cfgs:
+            print_cfg(cfg)
+    return 0
 
 # Exercise 2
-def do_liveness(fname):
-    print("LIVENESS not implemented")
-    return -1
+def do_liveness(fname, scheduler="rpo"):
+    for cfg in all_cfgs(astcache.parse_file(fname)):
+        live = Liveness(cfg, scheduler)
+        print(f"Liveness of {cfg.name} ({live.stats})")
+        for b in range(len(cfg)):
+            print(f"  {cfg.block_name(b)}  in {format_set(cfg, live.live_in[b])}"
+                  f"  out {format_set(cfg, live.live_out[b])}")
+            for stmt, before, after in live.statement_sets(b):
+                print(f"    {stmt.line}: {statement_text(stmt.ast_node)}"
+                      f"  in {format_set(cfg, before)}  out {format_set(cfg, after)}")
+    return 0
 
 # Exercise 3
-def do_reaching(fname):
-    print("REACHING not implemented")
-    return -1
+def do_reaching(fname, outname=None, scheduler="rpo"):
+    indexes = []
+    for cfg in all_cfgs(astcache.parse_file(fname)):
+        reaching = ReachingDefinitions(cfg, scheduler)
+        index = DefUseIndex.build(reaching)
+        indexes.append(index)
+        if outname is not None:
+            continue
+
+        def labels(mask):
+            return "{" + ", ".join(reaching.def_label(d) for d in bits(mask)) + "}"
+
+        # the definitions reaching each use, per statement
+        stmt_uses = {}
+        for (var, line, col, i), reach in zip(index.uses, index.chains):
+            stmt_uses.setdefault(i, []).append(f"{var} <- " + (", ".join(
+                f"{index.defs[d][0]}@{index.defs[d][1]}" for d in reach) or "?"))
+
+        print(f"Reaching definitions of {cfg.name} ({reaching.stats})")
+        for b in range(len(cfg)):
+            print(f"  {cfg.block_name(b)}  in {labels(reaching.reach_in[b])}  out {labels(reaching.reach_out[b])}")
+            for i in range(cfg.stmt_start[b], cfg.stmt_start[b + 1]):
+                stmt = cfg.statements[i]
+                used = "; ".join(stmt_uses.get(i, []))
+                print(f"    {stmt.line}: {statement_text(stmt.ast_node)}" + (f"  [{used}]" if used else ""))
+        print("  def-use chains")
+        for d, used in enumerate(index.def_uses):
+            var, line, _ = index.defs[d]
+            sites = ", ".join(f"{index.uses[u][1]}:{index.uses[u][2]}" for u in used) or "unused"
+            print(f"    {var}@{line} -> {sites}")
+    if outname is not None:
+        with open(outname, "w") as out:
+            json.dump({"file": fname, "indexes": [index.to_dict() for index in indexes]}, out)
+    return 0
+
+
+# every analysis under every scheduler, totalled over the file's graphs
+def do_solvers(fname):
+    cfgs = all_cfgs(astcache.parse_file(fname))
+    for analysis in (Liveness, ReachingDefinitions):
+        for scheduler in dataflow.SCHEDULERS:
+            total = None
+            for cfg in cfgs:
+                stats = analysis(cfg, scheduler).stats
+                if total is None:
+                    total = stats
+                else:
+                    total.add(stats)
+            if total is not None:
+                print(total)
+    return 0
+
+
+def do_ssa(fname, pruned=True):
+    for cfg in all_cfgs(astcache.parse_file(fname)):
+        ssa = SSAForm(cfg, pruned)
+        dom = ssa.dominators
+        print(f"SSA of {cfg.name} ({'pruned' if pruned else 'minimal'}, {ssa.phi_count()} phis)")
+        for b in range(len(cfg)):
+            idom = dom.idom[b]
+            frontier = ", ".join(cfg.block_name(d) for d in sorted(dom.frontier[b]))
+            print(f"  {cfg.block_name(b)}  idom {'-' if idom is None else cfg.block_name(idom)}"
+                  f"  frontier {{{frontier}}}")
+            preds = cfg.predecessors(b)
+            for x in ssa.phis[b]:
+                args = ", ".join(f"{cfg.block_name(p)}: {ssa.label(a)}" for p, a in zip(preds, ssa.phi_args[x]))
+                print(f"    {ssa.label(x)} = phi({args})")
+            for i in range(cfg.stmt_start[b], cfg.stmt_start[b + 1]):
+                stmt = cfg.statements[i]
+                defs = ", ".join(ssa.label(x) for x in ssa.stmt_defs[i])
+                uses = ", ".join(ssa.label(x) for x in ssa.stmt_uses[i])
+                print(f"    {stmt.line}: {statement_text(stmt.ast_node)}"
+                      + (f"  defs {defs}" if defs else "") + (f"  uses {uses}" if uses else ""))
+    return 0
+
+
+# --- pipeline ---
+
+# Liveness and reaching definitions of every scope of many files at once.
+# Scopes are independent, so they are the unit of work: a first pass over
+# the process pool lists each file's scopes with their size, the scopes
+# are then cut into runs of about the same total size (a big file spreads
+# over several runs, the scopes of small files are packed together into
+# one), and a second pass builds and analyzes the runs. Each worker parses
+# the files it is handed again, through astcache, which only helps within
+# one process. imap gives results back in job order, which is file then
+# source order, whoever finishes first.
+
+def measure_file(fname):
+    try:
+        tree = astcache.parse_file(fname)
+    except (SyntaxError, ValueError) as e:
+        return fname, [], f"Could not parse: {e}"
+    return fname, [scope_size(scope) for scope in all_scopes(tree)], None
+
+
+def analyze_scopes(job):
+    """(fname, results) for every (fname, start, end) piece of the run,
+    with the results of scopes start..end-1 of the file in source order."""
+    pieces, scheduler, with_index = job
+    return [(fname, analyze_piece(fname, start, end, scheduler, with_index))
+            for fname, start, end in pieces]
+
+
+def analyze_piece(fname, start, end, scheduler, with_index):
+    scopes = all_scopes(astcache.parse_file(fname))[start:end]
+    results = []
+    for scope in scopes:
+        cfg = make_cfg(scope)
+        live = Liveness(cfg, scheduler)
+        reaching = ReachingDefinitions(cfg, scheduler)
+        index = DefUseIndex.build(reaching)
+        # a module's or class's names are read from other scopes too
+        unused = []
+        if isinstance(scope, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            shared = shared_names(scope)
+            unused = [f"{var}@{line}" for (var, line, _), used in zip(index.defs, index.def_uses)
+                      if not used and var not in shared]
+        results.append({
+            "name": cfg.name,
+            "line": getattr(scope, "lineno", 1),
+            "blocks": len(cfg),
+            "statements": len(cfg.statements),
+            # live before anything is defined: may be read while unbound
+            "live_on_entry": cfg.mask_names(live.live_in[ENTRY]),
+            "unused": unused,
+            "stats": [live.stats, reaching.stats],
+            "index": index.to_dict() if with_index else None,
+        })
+    return results
+
+
+def pipeline_jobs(measured, workers, scheduler, with_index):
+    total = sum(sum(sizes) for _, sizes, _ in measured)
+    # a few runs per worker, so one slow run doesn't hold up the end
+    target = max(1, total // (workers * 8))
+    jobs = []
+    pieces, size = [], 0
+    for fname, sizes, _ in measured:
+        start = 0
+        for i, n in enumerate(sizes):
+            size += n
+            if size >= target:
+                pieces.append((fname, start, i + 1))
+                jobs.append((pieces, scheduler, with_index))
+                pieces, size, start = [], 0, i + 1
+        # what's left of the file waits for the next file's scopes
+        if start < len(sizes):
+            pieces.append((fname, start, len(sizes)))
+    if pieces:
+        jobs.append((pieces, scheduler, with_index))
+    return jobs
+
+
+def do_pipeline(path, outname=None, scheduler="rpo", workers=None):
+    started = time.perf_counter()
+    fnames = astcache.list_files(path)
+    workers = workers or os.cpu_count() or 1
+    totals = {}
+    scopes = 0
+    exported = []
+    with multiprocessing.Pool(workers) as pool:
+        measured = pool.map(measure_file, fnames, chunksize=max(1, len(fnames) // (workers * 8)))
+        for fname, _, error in measured:
+            if error:
+                print(f"{fname}: {error}")
+        jobs = pipeline_jobs(measured, workers, scheduler, outname is not None)
+        for fname, results in itertools.chain.from_iterable(pool.imap(analyze_scopes, jobs)):
+            for result in results:
+                scopes += 1
+                print(f"{fname}:{result['line']}: {result['name']} "
+                      f"({result['blocks']} blocks, {result['statements']} statements)")
+                if result["live_on_entry"]:
+                    print(f"    maybe unbound: {', '.join(result['live_on_entry'])}")
+                if result["unused"]:
+                    print(f"    unused: {', '.join(result['unused'])}")
+                for stats in result["stats"]:
+                    if stats.name in totals:
+                        totals[stats.name].add(stats)
+                    else:
+                        totals[stats.name] = stats
+                if outname is not None:
+                    exported.append({"file": fname, "line": result["line"], **result["index"]})
+    if outname is not None:
+        with open(outname, "w") as out:
+            json.dump({"indexes": exported}, out)
+    for stats in totals.values():
+        print(stats)
+    print(f"Analyzed {scopes} scopes of {len(fnames)} files on {workers} workers "
+          f"in {time.perf_counter() - started:.2f}s")
+    return 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+def myfunction():
+    x = 1
+    try:
+        x = int(input())  # may raise before x is reassigned
+    except ValueError:
+        print(x)  # reached by both x = 1 and x = int(...)
+    return x